@@ -157,6 +157,10 @@ ID_DIST_TRIANGULAR = 3
 ID_DIST_NORMAL = 4
 ID_DIST_LOGNORMAL = 5
 
+ID_SAMPLING_RANDOM = 0
+ID_SAMPLING_LATIN_HYPERCUBE = 1
+ID_SAMPLING_SOBOL = 2
+
 ID_YEARLY = 0
 ID_QUARTERLY = 1
 ID_MONTHLY = 2
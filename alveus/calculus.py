@@ -1,4 +1,5 @@
 import numpy as np
+from scipy.sparse import csr_matrix
 
 
 def _calculate_along(n, x=None, dx=1.):
@@ -94,4 +95,69 @@ def central_difference_2nd(y, x=None, dx=1.):
 
     dy = (hs2 * yd + (hd2 - hs2) * y[1:-1] - hd2 * ys) / (hs * hd * (hd + hs))
 
-    return np.insert(np.insert(dy, 0, (y[1] - y[0]) / (x[1] - x[0])), y.size - 1, (y[-1] - y[-2]) / (x[-1] - x[-2]))
\ No newline at end of file
+    return np.insert(np.insert(dy, 0, (y[1] - y[0]) / (x[1] - x[0])), y.size - 1, (y[-1] - y[-2]) / (x[-1] - x[-2]))
+
+
+def resample_rate(y, x, x_new):
+    """
+    Re-samples rates onto new x-values by forward integration, linear interpolation of the cumulative and backward
+    differencing. All columns are re-sampled together by a single sparse matrix product, see resampling_operator.
+    Parameters
+    ----------
+    y : array_like
+        Array (n, k) of rates at x
+    x : array_like
+        Array (n,) of x-values of the rates
+    x_new : array_like
+        Array (m,) of x-values to re-sample onto
+    """
+    return resampling_operator(x, x_new) @ y
+
+
+def resampling_operator(x, x_new):
+    """
+    Sparse linear operator (m, n) re-sampling rates at x onto x_new. Equal to
+    backward_difference(np.interp(x_new, x, forward_integration(y, x), left=0.), x_new), but each rate is the sum of the
+    integrated rates between two new x-values, without differencing the full cumulative.
+    Parameters
+    ----------
+    x : array_like
+        Array (n,) of x-values of the rates
+    x_new : array_like
+        Array (m,) of x-values to re-sample onto
+    """
+    n = x.size
+    m = x_new.size
+
+    if (n < 2) or (m < 2):
+        return csr_matrix((m, n))
+
+    # the cumulative at x_new[p] is sum(y[:k[p]] * dx[:k[p]]) + y[k[p]] * partial[p], with the cumulative 0. before
+    # x[0] and constant after x[-1]
+    dx = x[1:] - x[:-1]
+    j = np.searchsorted(x, x_new, side='right') - 1
+    k = np.clip(j, 0, n - 1)
+    partial = np.where((j >= 0) & (j < n - 1), x_new - x[k], 0.)
+
+    # each rate spans the columns from k of the lower to k of the upper x-value
+    counts = k[1:] - k[:-1] + 1
+    last = np.cumsum(counts) - 1
+    first = last - counts + 1
+
+    rows = np.repeat(np.arange(m - 1), counts)
+    cols = np.arange(counts.sum()) - np.repeat(first, counts) + np.repeat(k[:-1], counts)
+
+    data = dx[np.minimum(cols, n - 2)]
+    data[last] = partial[1:]
+    data[first] -= partial[:-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        data /= (x_new[1:] - x_new[:-1])[rows]
+
+    # backward differencing repeats the rate of the previous x-value at the last x-value
+    in_last = rows == m - 2
+    rows = np.concatenate((rows, np.full(np.count_nonzero(in_last), m - 1)))
+    cols = np.concatenate((cols, cols[in_last]))
+    data = np.concatenate((data, data[in_last]))
+
+    return csr_matrix((data, (rows, cols)), shape=(m, n))
@@ -1,4 +1,4 @@
-import copy
+import warnings
 import numpy as np
 
 from _errors import ConvergenceError
@@ -631,68 +631,195 @@ class NonParametricModelFit(ModelFit):
 # Merge functions
 # ======================================================================================================================
 class AssemblyFunction:
+    """
+    Function assembled from a chain of models. The chain is stored as a flat list of nodes, each evaluated once per
+    call in order, where every node transforms the value of the chain so far:
+        (_INITIAL, (model, multiplier, addition))
+        (_MERGE, (model, multiplier, addition, point, rate))
+        (_CONDITION, (model, multiplier, addition, condition, shift))
+        (_LIMIT, (lower, upper))
+    Contrary to nested closures, the nodes can be pickled and sent to worker processes.
+    """
     def __init__(self):
-        self._function = None
+        self._nodes = []
         self._offset = 0.
 
     # front-end functions (external) -----------------------------------------------------------------------------------
     def Add(self, model, merge_type, point, rate, multiplier, addition, args=()):
         if model.is_parametric:
-            f = self._generate_function(model, multiplier, addition)
+            term = (model, multiplier, addition)
         else:
-            f = self._generate_non_parametric_function(model, args)
+            term = self._generate_non_parametric_term(model, args)
 
         if merge_type == ID_SMOOTH:
-            self._function = self._merge_function(f, point, rate)
+            self._nodes.append((_MERGE, term + (point, rate)))
 
         elif merge_type == ID_COND:
             # find x0 at which existing function reaches point (on y)
             try:
-                x0 = secant(lambda x: self._function(x) - point, 0., 1.)
+                x0 = secant(lambda x: self._evaluate(x) - point, 0., 1.)
             except ConvergenceError:
                 raise ConvergenceError('Unable to find conditional point equivalent on x-axis')
             except TypeError:
                 raise  # missing parameters
 
-            self._function = self._conditional_function(f, x0, point)
+            # shift ensuring continuity at the conditional point
+            shift = self._evaluate(x0) - self._evaluate_term(x0, *term)
+            self._nodes.append((_CONDITION, term + (point, shift)))
 
     def GetOffset(self):
         return self._offset
 
     def SetInitial(self, model, multiplier, addition):
-        self._function = self._generate_function(model, multiplier, addition)
+        self._nodes = [(_INITIAL, (model, multiplier, addition))]
 
     def SetLimits(self, limits):
-        # final function to be called
-        f_exi = copy.deepcopy(self._function)
-        self._function = lambda x: np.clip(f_exi(x), *limits)
+        # final node to be evaluated
+        self._nodes.append((_LIMIT, tuple(limits)))
 
     def SetOffset(self, offset):
         self._offset = offset
 
     # back-end functions (external) ------------------------------------------------------------------------------------
     def eval(self, x):
-        return self._function(self._offset + x)
+        return self._evaluate(self._offset + x)
 
     # back-end functions (internal) ------------------------------------------------------------------------------------
+    def _evaluate(self, x):
+        y = None
+
+        for node, args in self._nodes:
+
+            if node == _INITIAL:
+
+                y = self._evaluate_term(x, *args)
+
+            elif node == _MERGE:
+
+                # idea from: https://math.stackexchange.com/questions/45321/smooth-transition-between-two-lines-2d
+                # (answer by Lubos Motl)
+                # can become unstable if fun1 becomes too large at high x-values
+                model, multiplier, addition, point, rate = args
+                f = self._evaluate_term(x, model, multiplier, addition)
+                y = y + (1. + np.tanh(rate * (x - point))) / 2. * (f - y)
+
+            elif node == _CONDITION:
+
+                model, multiplier, addition, condition, shift = args
+                f = self._evaluate_term(x, model, multiplier, addition)
+                y = np.where(y < condition, y, f + shift)
+
+            elif node == _LIMIT:
+
+                y = np.clip(y, *args)
+
+        return y
+
     @staticmethod
-    def _generate_function(model, multiplier, addition):
-        return lambda x: model.eval(x) * multiplier + addition
+    def _evaluate_term(x, model, multiplier, addition):
+        return model.eval(x) * multiplier + addition
 
-    def _generate_non_parametric_function(self, model, args):
+    def _generate_non_parametric_term(self, model, args):
         if model.method == ID_BOW:
-            fun = copy.deepcopy(self._function)
-            model.fit.initialize(fun, *args)
+            model.fit.initialize(self._evaluate, *args)
+
+        return model, 1., 0.
 
-        return lambda x: model.eval(x)
 
-    # idea from: https://math.stackexchange.com/questions/45321/smooth-transition-between-two-lines-2d
-    # (answer by Lubos Motl)
-    # can become unstable if fun1 becomes too large at high x-values
-    def _merge_function(self, f, p, k):
-        f_exi = copy.deepcopy(self._function)
-        return lambda x: f_exi(x) + (1. + np.tanh(k * (x - p))) / 2. * (f(x) - f_exi(x))
+# node types of AssemblyFunction
+_INITIAL = 0
+_MERGE = 1
+_CONDITION = 2
+_LIMIT = 3
+
+
+class TabulatedFunction:
+    """
+    Tabulation of a function (i.e. an AssemblyFunction) on an adaptive grid of x >= 0. The grid is built in fixed
+    segments [0, 1], [1, 2], [2, 4], ..., each refined independently, such that the value at a given x does not depend
+    on the range requested. Non-negative x beyond the table extends it, negative x is evaluated exactly. Within the
+    table the function is served by linear interpolation with a maximum error of approximately the tolerance.
+    Inverse look-ups are memoized.
+    """
+    def __init__(self, function, tolerance=1e-6, points=65, max_points=2 ** 12):
+        self._function = function
+        self._tolerance = tolerance
+        self._points = points          # points of the initial, uniform grid of a segment
+        self._max_points = max_points  # limit of the refined grid of a segment
 
-    def _conditional_function(self, f, x0, cond):
-        f_exi = copy.deepcopy(self._function)
-        return lambda x: np.where(f_exi(x) < cond, f_exi(x), f(x) + (f_exi(x0) - f(x0)))
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._segments = 0             # number of tabulated segments
+
+        self._inverse = {}             # {y: x}
+
+    # front-end functions (external) -----------------------------------------------------------------------------------
+    def GetFunction(self):
+        return self._function
+
+    # back-end functions (external) ------------------------------------------------------------------------------------
+    def eval(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        x_ = np.atleast_1d(x)
+
+        finite = np.isfinite(x_)
+        if finite.any():
+            self.tabulate(np.max(x_[finite]))
+
+        y = np.interp(x_, self._x, self._y)
+
+        outside = (x_ < 0.) | ~finite
+        if outside.any():
+            y[outside] = self._function.eval(x_[outside])
+
+        return y.reshape(x.shape)[()]
+
+    def inverse(self, y, x0=0., x1=1.):
+        # x at which the function equals y, found by secant on the tabulated function
+        if y not in self._inverse:
+            self._inverse[y] = secant(lambda x: self.eval(x) - y, x0, x1)
+
+        return self._inverse[y]
+
+    def tabulate(self, upper):
+        # tabulate the range [0, upper], unless already covered
+        while not self._segments or self._x[-1] < upper:
+            x, y = self._tabulate_segment(*self._segment(self._segments))
+
+            if self._segments:
+                x, y = x[1:], y[1:]  # first point is shared with the previous segment
+
+            self._x = np.append(self._x, x)
+            self._y = np.append(self._y, y)
+            self._segments += 1
+
+    # internal functions -----------------------------------------------------------------------------------------------
+    @staticmethod
+    def _segment(k):
+        return (0., 1.) if not k else (2. ** (k - 1), 2. ** k)
+
+    def _tabulate_segment(self, lower, upper):
+        x = np.linspace(lower, upper, self._points)
+        y = self._function.eval(x)
+
+        # bisect the intervals in which linear interpolation at the mid-point exceeds the tolerance
+        while True:
+            x_mid = (x[:-1] + x[1:]) / 2.
+            y_mid = self._function.eval(x_mid)
+
+            error = np.abs(y_mid - (y[:-1] + y[1:]) / 2.)
+            refine = np.flatnonzero(error > self._tolerance)
+            if not refine.size:
+                break
+
+            if x.size >= self._max_points:
+                warnings.warn('Tabulation on [{}, {}] is limited to {} points, with a maximum error of {:.3g} exceeding '
+                              'the tolerance of {:.3g}'.format(lower, upper, self._max_points, np.max(error),
+                                                               self._tolerance), RuntimeWarning)
+                break
+
+            refine = refine[:self._max_points - x.size]
+            x = np.insert(x, refine + 1, x_mid[refine])
+            y = np.insert(y, refine + 1, y_mid[refine])
+
+        return x, y
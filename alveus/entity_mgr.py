@@ -44,6 +44,9 @@ class EntityManager:
         # correlation matrix amongst polygons {id: {id: float}}
         self._correlation_matrix = {}
 
+        # production potentials of previous prediction runs
+        self._simulation_cache = sim.SimulationCache()
+
         # entity management
         self._id = 0
 
@@ -721,6 +724,10 @@ class EntityManager:
 
         case = sim.PredictionCase(properties)
 
+        # potentials of deleted predictions and producers are never re-used
+        self._simulation_cache.Retain(self._predictions, self._producers)
+        case.SetCache(self._simulation_cache, prediction.GetId())
+
         scenario = self.GetParentByType(prediction, ID_SCENARIO)
         s_id = scenario.GetId()
 
@@ -820,7 +827,7 @@ class EntityManager:
         """
 
         exclude = ('_projects', '_histories', '_scenarios', '_predictions', '_analogues', '_typecurves',
-                   '_scalings', '_correlation_matrix', '_id')
+                   '_scalings', '_correlation_matrix', '_simulation_cache', '_id')
 
         return (a.values() for a in GetAttributes(self, exclude=exclude, attr_only=True))
 
@@ -1211,7 +1218,7 @@ class EntityManager:
         for entities in self.GetSimulationHolders():
             for entity in entities:
                 result = entity.GetSimulationResult(simulation)
-                result.ClearSamples()
+                result.ClearSamples(case.CompactProfiles())
 
     def UpdateControlledProperties(self, entity):
         """
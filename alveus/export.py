@@ -43,7 +43,7 @@ def WriteProfile(ws, profile, variables, entity_names, phaser=False):
         if isinstance(variable, Date):
             array = array.astype(datetime)
         else:
-            array *= unit_conversions[j]
+            array = array * unit_conversions[j]
 
         for i in range(n):
             ws.cell(row=i+2, column=j + 2).value = array[i]
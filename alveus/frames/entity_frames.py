@@ -1780,6 +1780,8 @@ class PredictionFrame(EntityFrame):
         # try:
 
         prediction = self._entity_mgr.GetPredictionCase(self._entity)
+        prediction.SetConvergence(self._variable_mgr.GetSummaries(), self._settings)
+        prediction.SetStability(self._stability_variables, self.UpdateStability)
         prediction.Run(rho_v, rho_e)
         prediction.PostProcess(self._variable_mgr.GetSummaries(), self._settings)
 
@@ -1825,6 +1827,13 @@ class PredictionFrame(EntityFrame):
 
         self.DisplayChart()
 
+    def UpdateStability(self, stability):
+        # called by the prediction case as each block of samples completes, while running
+        self._stability = stability
+
+        self.DisplayChart()
+        self.Update()
+
     def DisplayChart(self):
         if self._stability is not None:
             axes_item = AxesItem()
@@ -1923,10 +1923,16 @@ class TimelinePanel(DynamicSectionPanel):
 
 class SamplingPanel(SectionPanel):
     def __init__(self, parent):
-        super().__init__(parent, 2, 2, 'Sampling', ico.swanson_distribution_16x16.GetBitmap())
+        super().__init__(parent, 6, 2, 'Sampling', ico.swanson_distribution_16x16.GetBitmap())
 
         self.AddCtrl(PropertyTextCtrl(self, vm.Samples()))
         self.AddCtrl(PropertyCheckBox(self, vm.SaveAllSamples()))
+        self.AddCtrl(PropertyTextCtrl(self, vm.Processes()))
+        self.AddCtrl(PropertyTextCtrl(self, vm.Seed()))
+        self.AddCtrl(PropertyTextCtrl(self, vm.ConvergenceTolerance()))
+        self.AddCtrl(PropertyBitmapComboBox(self, vm.SamplingMethod()))
+        self.AddCtrl(PropertyCheckBox(self, vm.CompactSamples()))
+        self.AddCtrl(PropertyTextCtrl(self, vm.TabulationTolerance()))
 
         self.Realize()
 
@@ -1,13 +1,54 @@
 import copy
+from functools import lru_cache, wraps
+
 import numpy as np
 
-from calculus import forward_integration, backward_difference
+from calculus import forward_integration, backward_difference, resampling_operator
 from utilities import return_property
 
 
+# maximum number of resampling operators cached, one per pair of source and target time
+_OPERATOR_CACHE_SIZE = 128
+
+# attributes of a Profile from which the memoized quantities are derived
+_MEMO_ATTRIBUTES = frozenset(('dates', 'times', 'values', 'offset', 'uptimes'))
+
+
+def _memoized(method):
+    # memoizes a derived quantity of a Profile until its arrays are replaced or modified, see Profile.modified. The
+    # memoized array is shared by all callers and therefore made read-only
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self):
+        if self._memo is None:
+            self._memo = {}
+
+        entry = self._memo.get(name)
+        if (entry is not None) and (entry[0] == self._version):
+            return entry[1]
+
+        value = method(self)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+        self._memo[name] = (self._version, value)
+        return value
+
+    return wrapper
+
+
 class Profile:
+    # an ensemble serves a Profile per sample, hence the attributes are slotted rather than held in a __dict__
+    __slots__ = ('_dates', '_start', 'times', 'values', 'offset', 'uptimes', '_memo', '_version')
+
     def __init__(self):
-        # time
+        # memoized quantities, {name: (version, value)}, see _memoized
+        self._memo = None
+        self._version = 0
+
+        # time. Compact profiles derive the dates from the start date and the times, see Profile.compact
+        self._start = None
         self.dates = np.array([], dtype='datetime64[D]')
         self.times = np.empty(0)
 
@@ -29,6 +70,62 @@ class Profile:
         # units            -                 -                   -                    -
         self.uptimes = np.empty((0, 4))
 
+    def __setattr__(self, name, value):
+        # replacing an array (including augmented assignment) invalidates the memoized quantities
+        if name in _MEMO_ATTRIBUTES:
+            self.modified()
+
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # memoized quantities are re-derived after un-pickling and copying
+        return {name: getattr(self, name) for name in self.__slots__ if name != '_memo'}
+
+    def __setstate__(self, state):
+        # state of profiles pickled prior to slots holds the dates rather than _dates and no start date
+        self._memo = None
+        self._version = state.get('_version', 0)
+        self._start = state.get('_start', None)
+        self._dates = state['_dates'] if '_dates' in state else state['dates']
+
+        for name in ('times', 'values', 'offset', 'uptimes'):
+            object.__setattr__(self, name, state[name])
+
+    @property
+    def dates(self):
+        return self._dates if self._dates is not None else self._derived_dates()
+
+    @dates.setter
+    def dates(self, dates):
+        self._dates = dates
+
+    def modified(self):
+        """
+        Invalidates the memoized quantities. Required after modifying values, uptimes, times or offset in place
+        """
+        self._version += 1
+
+    def compact(self):
+        """
+        Converts the profile to compact storage, in place. Potentials and uptimes are stored in single precision and the
+        dates are derived from the start date and the times on demand, if they equal the stored dates.
+
+        Single precision rounds each stored potential and uptime with a relative error of at most 2^-24 (6.0e-8).
+        Rates, cumulatives (integrated in double precision) and ratios are within 8 * 2^-24 (4.8e-7) of those of the
+        double precision profile, relative to themselves. Quantities of gas net of lift-gas share the bound relative to
+        the total gas instead, except for the oil-gas ratio, which is ill-conditioned as the net gas vanishes. Times and
+        dates are exact.
+        """
+        self.values = self.values.astype(np.float32)
+        self.uptimes = self.uptimes.astype(np.float32)
+
+        if self._dates is not None and self._dates.size:
+            start = self._dates[0]
+
+            if np.array_equal(start + self.times.astype(np.uint64), self._dates):
+                self._start = start
+                self.dates = None
+
     def pre_allocate(self, n):
         self.times = np.zeros(n)
         self.values = np.zeros((n, 6))
@@ -58,12 +155,20 @@ class Profile:
         self.uptimes = self.uptimes[:idx, :]
 
     def _integrate_rate(self, rate):
-        return forward_integration(rate / 1e3, self.time(), initial=0.)
+        # equal to forward_integration along the time axis (first axis), also of profiles viewing several samples.
+        # Integrated in double precision, also for compact profiles
+        rate = np.asarray(rate, dtype=np.float64)
+        dt = (self.times[1:] - self.times[:-1]).reshape((-1,) + (1,) * (rate.ndim - 1))
+        return np.cumsum(np.insert(rate[:-1] / 1e3 * dt, 0, 0., axis=0), axis=0)
 
     @staticmethod
     def _ratio(num, den):
         return np.where(den > 0., num / den, 0.)
 
+    @_memoized
+    def _derived_dates(self):
+        return self._start + self.times.astype(np.uint64)
+
     # get time / dates -------------------------------------------------------------------------------------------------
     def time(self):
         return self.times
@@ -130,84 +235,110 @@ class Profile:
     def water_injection_potential(self):
         return self.values[:, 5]
 
+    @_memoized
     def liquid_potential(self):
         return self.oil_potential() + self.water_potential()
 
+    @_memoized
     def gas_potential(self):
         return self.total_gas_potential() - self.lift_gas_potential()
 
     # get rates --------------------------------------------------------------------------------------------------------
+    @_memoized
     def oil_rate(self):
         return self.oil_potential() * self.production_uptime()
 
+    @_memoized
     def total_gas_rate(self):
         return self.gas_rate() + self.lift_gas_rate()
 
+    @_memoized
     def water_rate(self):
         return self.water_potential() * self.production_uptime()
 
+    @_memoized
     def lift_gas_rate(self):
         return self.lift_gas_potential() * self.lift_gas_uptime()
 
+    @_memoized
     def gas_injection_rate(self):
         return self.gas_injection_potential() * self.gas_injection_uptime()
 
+    @_memoized
     def water_injection_rate(self):
         return self.water_injection_potential() * self.water_injection_uptime()
 
+    @_memoized
     def liquid_rate(self):
         return self.liquid_potential() * self.production_uptime()
 
+    @_memoized
     def gas_rate(self):
         return self.gas_potential() * self.production_uptime()
 
     # get cums ---------------------------------------------------------------------------------------------------------
+    @_memoized
     def oil_cumulative(self):
         return self._integrate_rate(self.oil_rate()) + self.offset[0]
 
+    @_memoized
     def total_gas_cumulative(self):
         return self._integrate_rate(self.total_gas_rate()) + self.offset[1]
 
+    @_memoized
     def water_cumulative(self):
         return self._integrate_rate(self.water_rate()) + self.offset[2]
 
+    @_memoized
     def lift_gas_cumulative(self):
         return self._integrate_rate(self.lift_gas_rate()) + self.offset[3]
 
+    @_memoized
     def gas_injection_cumulative(self):
         return self._integrate_rate(self.gas_injection_rate()) + self.offset[4]
 
+    @_memoized
     def water_injection_cumulative(self):
         return self._integrate_rate(self.water_injection_rate()) + self.offset[5]
 
+    @_memoized
     def liquid_cumulative(self):
         return self._integrate_rate(self.liquid_rate()) + (self.offset[0] + self.offset[1])
 
+    @_memoized
     def gas_cumulative(self):
         return self._integrate_rate(self.gas_rate()) + (self.offset[1] - self.offset[3])
 
     # get ratio's ------------------------------------------------------------------------------------------------------
+    @_memoized
     def water_cut(self):
         return self._ratio(self.water_potential(), self.liquid_potential())
 
+    @_memoized
     def oil_cut(self):
         return self._ratio(self.oil_potential(), self.liquid_potential())
 
+    @_memoized
     def gas_oil_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.gas_potential(), self.oil_potential()), 0.)
 
+    @_memoized
     def water_oil_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.water_potential(), self.oil_potential()), 0.)
 
+    @_memoized
     def gas_liquid_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.gas_potential(), self.liquid_potential()), 0.)
 
+    @_memoized
     def water_gas_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.water_potential(), self.liquid_potential()), 0.)
 
+    @_memoized
     def oil_gas_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.oil_potential(), self.gas_potential()), 0.)
 
+    @_memoized
     def total_gas_liquid_ratio(self):
         return np.where(self.uptimes[:, 0] > 0., self._ratio(self.total_gas_rate(), self.liquid_rate()), 0.)  # rate because it uses different uptimes
 
@@ -274,6 +405,8 @@ class Profile:
             self.values[:, 3] = np.clip(tglr * liquid - self.values[:, 1], 0., None)
             self.values[:, 1] += self.values[:, 3]
 
+        self.modified()
+
     # resample methods -------------------------------------------------------------------------------------------------
     def resample(self, dateline, inplace=False):
         # pre-allocate
@@ -309,9 +442,8 @@ class Profile:
         else:
             _fractions = fractions
 
-        # re-sampling based on cum
-        for i, fraction in zip(range(6), _fractions):
-            self.values[:, i] += self.interpolate_rate(profile.time(), profile.values[:, i], uptime=1.) * fraction
+        # re-sampling based on cum, all columns at once
+        self.values += _resampling_operator(profile.time(), self.time()) @ profile.values * _fractions
 
         self.offset += profile.offset  # TODO: need * _fractions as well?
 
@@ -324,13 +456,13 @@ class Profile:
 
         rates = np.zeros((self.times.size, 6))
 
-        for p, fraction in zip(profiles, _fractions):
+        for p, fraction, resampled in zip(profiles, _fractions, self.interpolate_rates(profiles)):
             # re-sampling based on cum
-            self.add(p, fractions=fraction)
+            self.values += resampled[:, :6] * fraction
+            self.offset += p.offset
 
             # calculate rates for later calculation of uptimes
-            for i in range(6):
-                rates[:, i] += self.interpolate_rate(p.time(), p.values[:, i], p.uptime(i)) * fraction[i]
+            rates += resampled[:, 6:] * fraction
 
         self.calculate_uptime(self.values, rates)
 
@@ -338,7 +470,33 @@ class Profile:
         cum = np.interp(self.time(), time, forward_integration(value * uptime, time, initial=0.), left=0.)
         return backward_difference(cum, self.time())
 
+    def interpolate_rates(self, profiles):
+        """
+        Potentials and rates of profiles re-sampled onto the time of this profile. Profiles sharing the same time are
+        re-sampled together by a single product with their cached resampling operator
+        :param profiles: list of class Profile()
+        :return: list of arrays (time, 12), potentials in columns 0-5 and rates in columns 6-11
+        """
+        groups = {}  # {time: [index, ...]}
+        for k, profile in enumerate(profiles):
+            groups.setdefault(profile.time().tobytes(), []).append(k)
+
+        resampled = [None for _ in profiles]
+
+        for indices in groups.values():
+            columns = [np.hstack((profiles[k].values, profiles[k].values * profiles[k].uptimes[:, _UPTIME_COLUMNS]))
+                       for k in indices]
+
+            values = _resampling_operator(profiles[indices[0]].time(), self.time()) @ np.hstack(columns)
+
+            for n, k in enumerate(indices):
+                resampled[k] = values[:, 12 * n:12 * (n + 1)]
+
+        return resampled
+
     def calculate_uptime(self, potentials, rates):
+        self.modified()
+
         # calculate production uptime
         self.uptimes[:, 0] = np.where(potentials[:, 0] > 0., rates[:, 0] / potentials[:, 0],
                                 np.where(potentials[:, 1] > 0., rates[:, 1] / potentials[:, 1],
@@ -389,6 +547,14 @@ class Profile:
             return merged
 
     # auxiliary (back-end) ---------------------------------------------------------------------------------------------
+    def get_many(self, ids):
+        """
+        Several variables at once. Potentials, rates and cumulatives are derived once and shared between the variables
+        :param ids: list of str, Profile variables
+        :return: list of arrays
+        """
+        return [getattr(self, id_)() for id_ in ids]
+
     def allocate(self, dateline):
         self.pre_allocate(dateline.size)
         self.dates = dateline
@@ -404,6 +570,12 @@ class Profile:
     def Get(self, id_):
         return getattr(self, id_)()
 
+    def GetMany(self, ids):
+        """
+        Front-end wrapper to get_many
+        """
+        return self.get_many(ids)
+
     def Add(self, profile):
         """
         Front-end wrapper to add
@@ -415,3 +587,193 @@ class Profile:
         Front-end wrapper to sum
         """
         self.sum(profiles)
+
+
+# uptime column associated to each value column, see Profile.uptime
+_UPTIME_COLUMNS = (0, 0, 0, 1, 2, 3)
+
+
+def _resampling_operator(time, target):
+    # resampling operator from time to target, cached by the contents of both time vectors
+    return _cached_operator(np.ascontiguousarray(time, dtype=np.float64).tobytes(),
+                            np.ascontiguousarray(target, dtype=np.float64).tobytes())
+
+
+@lru_cache(maxsize=_OPERATOR_CACHE_SIZE)
+def _cached_operator(time, target):
+    return resampling_operator(np.frombuffer(time), np.frombuffer(target))
+
+
+class Ensemble:
+    """
+    Columnar storage of an ensemble of profiles sharing a single dateline. The values, uptimes and offsets of all
+    samples are held in single arrays of shape (samples, time, 6), (samples, time, 4) and (samples, 6). Each sample is
+    served as a light-weight Profile, whose arrays are views into the arrays of the ensemble. Views are created on first
+    access, as the columnar arrays suffice for shading and summaries.
+    """
+    def __init__(self, dateline=None, samples=0, dtype=np.float64):
+        if dateline is None:
+            dateline = np.array([], dtype='datetime64[D]')
+
+        # time, shared by all samples
+        self.dates = dateline
+        self.times = (dateline - dateline[0]).astype(np.float64) if dateline.size else np.empty(0)
+
+        # values, uptimes and offsets of all samples, see Profile for the column indices
+        self.values = np.zeros((samples, dateline.size, 6), dtype=dtype)
+        self.uptimes = np.ones((samples, dateline.size, 4), dtype=dtype)
+        self.offsets = np.zeros((samples, 6), dtype=dtype)
+
+        self._profiles = {}  # {sample: Profile()}, views of the samples accessed
+        self._set_profiles()
+
+    def __getstate__(self):
+        # views are re-created on un-pickling, as pickling would copy the data of each view
+        state = self.__dict__.copy()
+        state['_profiles'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_profiles()
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, i):
+        i = range(len(self))[i]
+
+        if i not in self._profiles:
+            self._profiles[i] = self._view(i)
+
+        return self._profiles[i]
+
+    # back-end functions -----------------------------------------------------------------------------------------------
+    @staticmethod
+    def stack(profiles, dtype=np.float64):
+        """
+        Columnar ensemble of a list of profiles sharing the same dateline
+        :param profiles: list of class Profile()
+        :param dtype: data type of the ensemble arrays
+        :return: class Ensemble()
+        """
+        if not len(profiles):
+            return Ensemble(dtype=dtype)
+
+        ensemble = Ensemble(profiles[0].dates, len(profiles), dtype=dtype)
+        ensemble.times = profiles[0].times
+
+        for i, profile in enumerate(profiles):
+            ensemble.values[i, :, :] = profile.values
+            ensemble.uptimes[i, :, :] = profile.uptimes
+            ensemble.offsets[i, :] = profile.offset
+
+        return ensemble
+
+    def subset(self, indices):
+        # ensemble of the samples at the given indices
+        ensemble = Ensemble(self.dates, 0, dtype=self.values.dtype)
+        ensemble.times = self.times
+        ensemble.values = self.values[indices, :, :]
+        ensemble.uptimes = self.uptimes[indices, :, :]
+        ensemble.offsets = self.offsets[indices, :]
+        ensemble._set_profiles()
+
+        return ensemble
+
+    def get(self, id_):
+        # variable of all samples, (samples, time)
+        values = self._time_major().Get(id_)
+        values = values.T if values.ndim == 2 else values
+        return np.ascontiguousarray(np.broadcast_to(values, (len(self), self.dates.size)))
+
+    def add(self, ensemble):
+        """
+        Adds the samples of an ensemble on the same dateline, equal to Profile.add of each sample, but as a single array
+        addition without re-sampling
+        :param ensemble: class Ensemble()
+        """
+        n = len(ensemble)
+        self.values[:n, :, :] += ensemble.potentials()
+        self.offsets[:n, :] += ensemble.offsets
+
+        self.modified()
+
+    def aligns(self, ensemble):
+        # check whether an ensemble can be added directly, i.e. shares the dateline and does not hold more samples
+        return (len(ensemble) <= len(self)) and (self.dates.size > 1) and (ensemble.dates.shape == self.dates.shape) \
+               and np.array_equal(ensemble.dates, self.dates)
+
+    def potentials(self):
+        # potentials of all samples, re-sampled as Profile.interpolate_rate onto the same dateline, (samples, time, 6)
+        return self._interpolate_rate(self.values.copy())
+
+    def rates(self):
+        # rates of all samples, re-sampled as Profile.interpolate_rate onto the same dateline, (samples, time, 6)
+        uptimes = np.take(self.uptimes, _UPTIME_COLUMNS, axis=2)
+        return self._interpolate_rate(np.multiply(self.values, uptimes))
+
+    def calculate_uptime(self, rates):
+        """
+        Calculates the uptimes of all samples at once, using a Profile viewing the ensemble with time as first axis
+        :param rates: array (samples, time, 6) of summed rates
+        """
+        profile = self._time_major()
+        profile.calculate_uptime(profile.values, rates.transpose(1, 2, 0))
+
+        self.modified()
+
+    def compact(self):
+        """
+        Converts the ensemble to compact storage, in place, storing potentials and uptimes in single precision. Offsets
+        remain in double precision. The accuracy of the derived quantities is bounded as given in Profile.compact
+        """
+        self.values = self.values.astype(np.float32)
+        self.uptimes = self.uptimes.astype(np.float32)
+
+        # views are updated rather than re-created, as they may be held by the front-end
+        for i, profile in self._profiles.items():
+            profile.values = self.values[i]
+            profile.uptimes = self.uptimes[i]
+
+    def modified(self):
+        # invalidates the memoized quantities of each sample, required after modifying the arrays in place
+        for profile in self._profiles.values():
+            profile.modified()
+
+    @staticmethod
+    def _interpolate_rate(rate):
+        # Profile.interpolate_rate onto the time-steps of the rate itself, which returns the rate of each time-step,
+        # except at the last time-step where the backward difference returns the rate of the previous time-step.
+        # Applied in place
+        rate[:, -1, :] = rate[:, -2, :]
+        return rate
+
+    def _time_major(self):
+        # profile viewing all samples at once, with arrays (time, 6, samples), (time, 4, samples) and (6, samples)
+        profile = Profile()
+        profile.dates = self.dates
+        profile.times = self.times
+        profile.values = self.values.transpose(1, 2, 0)
+        profile.uptimes = self.uptimes.transpose(1, 2, 0)
+        profile.offset = self.offsets.T
+
+        return profile
+
+    def _set_profiles(self):
+        # discards the views, required after replacing the arrays of the ensemble
+        self._profiles = {}
+
+    def _view(self, i):
+        profile = Profile()
+        profile.dates = self.dates
+        profile.times = self.times
+        profile.values = self.values[i]
+        profile.uptimes = self.uptimes[i]
+        profile.offset = self.offsets[i]
+
+        return profile
+
@@ -4,7 +4,7 @@ from _ids import *
 from _errors import AssembleError, ConvergenceError
 from utilities import GetAttributes, ReturnProperty, ReturnProperties
 
-from profile_ import Profile
+from profile_ import Profile, Ensemble
 from optimize import secant
 from curve_fit import AssemblyFunction
 from statistics import *
@@ -830,16 +830,40 @@ class SamplingProperty(PropertyGroup):
 
         self._samples = None
         self._save_all = False
+        self._processes = None
+        self._seed = None
+        self._tolerance = None
+        self._method = None
+        self._compact = False
+        self._tabulation = None
+
+    def __setstate__(self, state):
+        # properties saved before a sampling option was added are completed with its default
+        self.__init__()
+        self.__dict__.update(state)
 
     def get(self):
-        return ReturnProperty(self._samples, default=1), self._save_all
+        tolerance = self._tolerance / 100. if self._tolerance is not None else None
+        method = ReturnProperty(self._method, default=ID_SAMPLING_RANDOM)
+
+        return ReturnProperty(self._samples, default=1), self._save_all, ReturnProperty(self._processes, default=1), \
+               ReturnProperty(self._seed, default=0), tolerance, method, self._compact, \
+               ReturnProperty(self._tabulation, default=1e-6)
 
     def Get(self):
-        return self._samples, self._save_all
+        return self._samples, self._save_all, self._processes, self._seed, self._tolerance, self._method, self._compact, \
+               self._tabulation
 
-    def Set(self, samples, save_all):
+    def Set(self, samples, save_all, processes=None, seed=None, tolerance=None, method=None, compact=False,
+            tabulation=None):
         self._samples = samples
         self._save_all = save_all
+        self._processes = processes
+        self._seed = seed
+        self._tolerance = tolerance
+        self._method = method
+        self._compact = compact
+        self._tabulation = tabulation
 
 
 class ScalingProperty(HierarchicalProperty):
@@ -1115,6 +1139,12 @@ class UncertaintyProperty(PropertyGroup):
         self._parameters = parameters
 
     def sample(self, x, value):
+        """
+        Samples the distribution for an array of standard normal samples, validating the parameters once
+        :param x: float or array, standard normal samples
+        :param value: float, value to which the sampled distribution is applied as a multiplier
+        :return: float or array of the same shape as x
+        """
 
         if self._parameters and any(self._parameters):
             par1, par2, par3 = ReturnProperties(self._parameters, defaults=(0., 0., 0.))
@@ -1306,6 +1336,109 @@ class EventList:
         self._events = events
 
 
+class SummaryTable:
+    """
+    Columnar storage of the summaries of an ensemble, as an array (samples, summaries). Each sample is served as a
+    dictionary-like row {summary_id: float}.
+    """
+    def __init__(self, ids=(), samples=0):
+        self._ids = list(ids)                                        # list, summary ids in column order
+        self._columns = {id_: j for j, id_ in enumerate(self._ids)}  # dict, {summary_id: column}
+        self.values = np.zeros((samples, len(self._ids)))
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __iter__(self):
+        return (SummaryRow(self, i) for i in range(len(self)))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+
+        if not 0 <= i < len(self):
+            raise IndexError('Summary sample index out of range')
+
+        return SummaryRow(self, i)
+
+    # back-end functions -----------------------------------------------------------------------------------------------
+    @staticmethod
+    def from_dicts(summaries):
+        # columnar table of a list of summary dictionaries [{summary_id: float}, ...]
+        table = SummaryTable(summaries[0].keys() if len(summaries) else (), len(summaries))
+
+        for i, summary in enumerate(summaries):
+            for id_, value in summary.items():
+                table.values[i, table.column(id_)] = value
+
+        return table
+
+    def add(self, id_):
+        if id_ not in self._columns:
+            self._columns[id_] = len(self._ids)
+            self._ids.append(id_)
+            self.values = np.hstack((self.values, np.zeros((len(self), 1))))
+
+    def column(self, id_):
+        return self._columns[id_]
+
+    def delete(self, id_):
+        j = self._columns.pop(id_)
+        del self._ids[j]
+        self._columns = {id_: k for k, id_ in enumerate(self._ids)}
+        self.values = np.delete(self.values, j, axis=1)
+
+    def get(self, id_):
+        # values of a summary of all samples
+        return self.values[:, self._columns[id_]]
+
+    def ids(self):
+        return self._ids
+
+    def merge(self, table):
+        # add the summaries of another table, sample by sample
+        for id_ in table.ids():
+            self.values[:, self._columns[id_]] += table.get(id_)
+
+    def subset(self, indices):
+        table = SummaryTable(self._ids)
+        table.values = self.values[indices, :]
+        return table
+
+
+class SummaryRow:
+    """
+    Dictionary-like view of the summaries of a single sample in a SummaryTable
+    """
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __contains__(self, id_):
+        return id_ in self._table.ids()
+
+    def __getitem__(self, id_):
+        return self._table.values[self._i, self._table.column(id_)]
+
+    def __setitem__(self, id_, value):
+        self._table.values[self._i, self._table.column(id_)] = value
+
+    def __iter__(self):
+        return iter(self._table.ids())
+
+    def __len__(self):
+        return len(self._table.ids())
+
+    def items(self):
+        return zip(self._table.ids(), self._table.values[self._i, :])
+
+    def keys(self):
+        return list(self._table.ids())
+
+    def values(self):
+        return self._table.values[self._i, :]
+
+
 class SimulationResult:
     def __init__(self, lmh=(), profiles=(), summaries=(), lmh_p=(), shading=False, finalized=False):
 
@@ -1316,14 +1449,42 @@ class SimulationResult:
         self._shading = shading      # bool, check for whether shading is included in the simulation
 
         self._finalized = finalized  # bool, check for whether hierarchical propagation is finalized
-        self._profiles = profiles    # list, containing classes [Profile(), ...]
-        self._summaries = summaries  # list, dictionaries with [{summary_id: float}, ...]
-        self._rates = []             # list, numpy arrays with sums of rates, used for calculating uptimes
+
+        self._profiles = self._as_ensemble(profiles)       # class Ensemble(), serving [Profile(), ...]
+        self._summaries = self._as_summary_table(summaries)  # class SummaryTable(), serving [{summary_id: float}, ...]
+        self._rates = None                                    # array (samples, time, 6), sums of rates for uptimes
+        self._distributions = {}                              # dict, shading {(variable, resolution, ...): array}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_distributions'] = {}
+        return state
+
+    def __setstate__(self, state):
+        # results saved before ensembles hold lists of profiles and summaries and a list of rates
+        self.__init__()
+        self.__dict__.update(state)
+
+        self._profiles = self._as_ensemble(self._profiles)
+        self._summaries = self._as_summary_table(self._summaries)
+
+        if not isinstance(self._rates, np.ndarray):
+            self._rates = None
+
+        self._distributions = {}
 
     # back-end code ----------------------------------------------------------------------------------------------------
     def get_lmh(self):
         return self._lmh
 
+    @staticmethod
+    def _as_ensemble(profiles):
+        return profiles if isinstance(profiles, Ensemble) else Ensemble.stack(profiles)
+
+    @staticmethod
+    def _as_summary_table(summaries):
+        return summaries if isinstance(summaries, SummaryTable) else SummaryTable.from_dicts(summaries)
+
     # front-end code ---------------------------------------------------------------------------------------------------
     def AddSummary(self, id_):
         """
@@ -1335,20 +1496,26 @@ class SimulationResult:
             Id index to add to dictionary
         """
 
-        for summary in self._summaries:
-            summary[id_] = 0.
+        self._summaries.add(id_)
 
-    def ClearSamples(self):
+    def ClearSamples(self, compact=False):
         if (not self._shading) and self._lmh:
-            self._profiles = [self._profiles[i] for i in self._lmh]
-            self._summaries = [self._summaries[i] for i in self._lmh]
+            self._profiles = self._profiles.subset(list(self._lmh))
+            self._summaries = self._summaries.subset(list(self._lmh))
             self._lmh = [0, 1, 2]
 
-        self._rates = []
+        # store potentials and uptimes in single precision, see Profile.compact
+        if compact:
+            self._profiles.compact()
+
+            for profile in self._lmh_p:
+                profile.compact()
+
+        self._rates = None
+        self._distributions = {}
 
     def DeleteSummary(self, id_):
-        for summary in self._summaries:
-            del summary[id_]
+        self._summaries.delete(id_)
 
     def FinalizeSamples(self, shading, settings):
         extraction = settings.GetExtraction()
@@ -1359,13 +1526,13 @@ class SimulationResult:
         weights = np.full(len(extraction), 1. / len(extraction))
         cases = settings.GetCases(False)
 
-        for i, sample in enumerate(self._profiles):
-            sample.calculate_uptime(sample.values, self._rates[i])
+        self._profiles.calculate_uptime(self._rates)
 
         self._lmh = ExtractRealizations(self._summaries, extraction, weights, cases)
 
         self._finalized = True
         self._shading = shading
+        self._distributions = {}
 
     def GetHighProfile(self, variable=None):
         if variable is None:
@@ -1420,36 +1587,48 @@ class SimulationResult:
         return self._summaries
 
     def GetShading(self, resolution, low, high, variable=None):
-        shade = np.linspace(low, high, resolution + 1)
+        if not self._shading:
+            return None
+
+        key = (variable, resolution, low, high)
 
-        if self._shading:
-            return EnsembleDistribution(self._profiles, variable, shade)
+        if key not in self._distributions:
+            shade = np.linspace(low, high, resolution + 1)
+            self._distributions[key] = EnsembleDistribution(self._profiles, variable, shade)
+
+        return self._distributions[key]
 
     def HasShading(self):
         return self._shading
 
     def InitializeSamples(self, n, dateline, summaries):
-        self._profiles = [Profile() for _ in range(n)]
-        for p in self._profiles:
-            p.Allocate(dateline)
-
-        self._rates = [np.zeros((dateline.size, 6)) for _ in range(n)]
-        self._summaries = [{summary.GetId(): 0. for summary in summaries} for _ in range(n)]
+        self._profiles = Ensemble(dateline, n)
+        self._rates = np.zeros((n, dateline.size, 6))
+        self._summaries = SummaryTable([summary.GetId() for summary in summaries], n)
+        self._distributions = {}
 
     def IsFinalized(self):
         return self._finalized
 
     def MergeProfile(self, profiles):
-        for i, profile in enumerate(profiles):
-            self._profiles[i].Add(profile)
+        self._distributions = {}
+
+        # samples on the same dateline are summed directly, avoiding re-sampling each sample
+        if isinstance(profiles, Ensemble) and self._profiles.aligns(profiles):
+            self._profiles.add(profiles)
+            self._rates[:len(profiles), :, :] += profiles.rates()
+            return
 
-            for j in range(6):
-                self._rates[i][:, j] += self._profiles[i].interpolate_rate(profile.time(), profile.values[:, j], profile.uptime(j))
+        # samples share the dateline of the ensemble, hence all are re-sampled in a single call
+        resampled = self._profiles[0].interpolate_rates(list(profiles)) if len(profiles) else []
+
+        for i, (profile, values) in enumerate(zip(profiles, resampled)):
+            self._profiles[i].values += values[:, :6]
+            self._profiles[i].offset += profile.offset
+            self._rates[i, :, :] += values[:, 6:]
 
     def MergeSummary(self, summaries):
-        for i, summary in enumerate(summaries):
-            for id_, value in summary.items():
-                self._summaries[i][id_] += value
+        self._summaries.merge(summaries)
 
 
 # ======================================================================================================================
@@ -1533,6 +1712,27 @@ class SummaryProperty:
 
         return scalar * mult
 
+    def compile(self):
+        """
+        Compiles the summary for evaluation on all samples of an ensemble at once, equal to Calculate of each sample
+        :return: class SummaryReducer()
+        """
+
+        # pre-compile multiplier expression
+        code = None
+
+        if self._eval and (self._eval is not None):
+            try:
+                code = compile(self._eval, '<summary>', 'eval')
+
+            except SyntaxError:
+                raise SyntaxError('Error in statement: \'{}\''.format(self._eval))
+
+        function = ReturnProperty(self._function, default=ID_POINT)
+        point = ReturnProperty(self._point, default=ID_POINT_LAST)
+
+        return SummaryReducer(self._production, code, function, point, self._date, self._time)
+
     def Get(self):
         return self._production, self._icon, self._eval, self._function, self._point, self._date, self._time
 
@@ -1546,6 +1746,121 @@ class SummaryProperty:
         self._time = time
 
 
+class SummaryReducer:
+    """
+    Summary compiled by SummaryProperty.compile, reducing the production profiles of all samples of an ensemble at once.
+    The time index of a point is calculated once per dateline.
+    """
+    def __init__(self, production, code, function, point, date, time):
+        self._production = production  # str, Profile variable
+        self._code = code              # code object of the multiplier expression or None
+        self._function = function      # int, ID_POINT, ID_SUM or ID_AVERAGE
+        self._point = point            # int, ID_POINT_FIRST, ID_POINT_LAST, ID_POINT_DATE or ID_POINT_TIME
+        self._date = date
+        self._time = time
+
+        self._dates = None             # dateline of the pre-calculated index
+        self._idx = None               # int, pre-calculated time index of a point
+
+    def reduce(self, ensemble, property_map):
+        """
+        Summary of all samples of an ensemble
+        :param ensemble: class Ensemble()
+        :param property_map: dict, names available to the multiplier expression
+        :return: array (samples,)
+        """
+
+        # calculate multiplier
+        mult = 1.
+
+        if self._code is not None:
+            try:
+                mult = eval(self._code, {}, property_map)
+
+            except ZeroDivisionError:
+                return np.zeros(len(ensemble))
+
+        # calculate scalars from production profiles
+        scalars = np.zeros(len(ensemble))
+
+        if self._function == ID_POINT:
+
+            idx = self._index(ensemble)
+
+            if idx is not None:
+                scalars = ensemble.get(self._production)[:, idx]
+
+        elif self._function == ID_SUM:
+
+            scalars = np.sum(ensemble.get(self._production), axis=1)
+
+        elif self._function == ID_AVERAGE:
+
+            scalars = np.mean(ensemble.get(self._production), axis=1)
+
+        return scalars * mult
+
+    def _index(self, ensemble):
+        if ensemble.dates is self._dates:
+            return self._idx
+
+        idx = None
+
+        if self._point == ID_POINT_FIRST:
+
+            idx = 0
+
+        elif self._point == ID_POINT_LAST:
+
+            idx = -1
+
+        elif self._point == ID_POINT_DATE:
+
+            date = ensemble.dates
+            idx = -1 if self._date > date[-1] else np.argmax(date >= self._date)
+
+        elif self._point == ID_POINT_TIME:
+
+            days = self._time * 365.25
+            time = ensemble.times
+            idx = -1 if days >= time[-1] else np.argmax(time >= days)
+
+        self._dates = ensemble.dates
+        self._idx = idx
+
+        return idx
+
+
+class SummaryEvaluator:
+    """
+    Summaries compiled once for evaluation on any number of ensembles, returning the summaries of all samples at once
+    """
+    def __init__(self, summaries):
+        self._ids = [summary.GetId() for summary in summaries]
+        self._reducers = [summary.GetProperties().compile() for summary in summaries]
+
+    def evaluate(self, ensemble, property_map, ignore_undefined=False):
+        """
+        Summaries of all samples of an ensemble
+        :param ensemble: class Ensemble()
+        :param property_map: dict, names available to the multiplier expressions
+        :param ignore_undefined: bool, if True summaries using names not in the property_map are 0, otherwise raise
+        :return: class SummaryTable()
+        """
+
+        table = SummaryTable(self._ids, len(ensemble))
+
+        for j, reducer in enumerate(self._reducers):
+            try:
+                table.values[:, j] = reducer.reduce(ensemble, property_map)
+
+            except NameError:
+                if not ignore_undefined:
+                    raise
+
+        return table
+
+
 # ======================================================================================================================
 # Grouping properties as they will be supplied to Entities. They have both front-end and a back-end methods.
 # ======================================================================================================================
@@ -1,136 +1,475 @@
+import hashlib
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import numpy.random as random
-from scipy.optimize import linprog  # TODO: REMOVE
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix
+from scipy.special import ndtri
+from scipy.stats import qmc
 
 
-from properties import SimulationResult
+from properties import SimulationResult, SummaryEvaluator, SummaryTable
 from timeline import sample_timeline, merge_datelines
-from profile_ import Profile
+from profile_ import Profile, Ensemble
 from optimize import secant
-from statistics import stnormal2stuniform, extract_realizations
+from curve_fit import TabulatedFunction
+from statistics import stnormal2stuniform, extract_realizations, correlation_factor, percentile_confidence, \
+    RunningStatistics
 
 from _ids import *
 from _errors import AssembleError, ConvergenceError
 
 
+# maximum number of realizations simulated together in a batch, bounding the memory of the batched arrays
+_BATCH_SIZE = 4096
+
+# number of samples drawn from each random stream, samples are drawn in blocks per polygon
+_SAMPLE_BLOCK = 64
+
+# number of samples simulated between convergence checks of adaptive sampling
+_ADAPTIVE_BLOCK = 4 * _SAMPLE_BLOCK
+
+# maximum number of bytes of production potentials and number of correlation factors held by the simulation cache
+_CACHE_SIZE = 2 ** 30
+_CACHE_FACTORS = 16
+
+# columns of the performance values [oil, total_gas, water, lift_gas, gas_inj, water_inj] and the streams contributing
+# to each network phase, {ID_PHASE_NW: ((column, stream ID_PHASE_NW), ...)}
+_PHASE_COLUMNS = {ID_OIL_NW:       ((0, ID_OIL_NW),),
+                  ID_GAS_NW:       ((1, ID_GAS_NW),),
+                  ID_WATER_NW:     ((2, ID_WATER_NW),),
+                  ID_LIQUID_NW:    ((0, ID_OIL_NW), (2, ID_WATER_NW)),
+                  ID_INJ_GAS_NW:   ((4, ID_INJ_GAS_NW),),
+                  ID_INJ_WATER_NW: ((5, ID_INJ_WATER_NW),),
+                  ID_LIFT_GAS_NW:  ((3, ID_LIFT_GAS_NW),)}
+
+
 # ======================================================================================================================
 # Performance Table
 # ======================================================================================================================
-class PerformanceTable:
-    def __init__(self, profile):
+class FieldPerformanceTable:
+    """
+    Performance of all wells of a single sample during constrained simulation, stored in contiguous arrays of shape
+    (wells, time, ...). The wells' profiles are re-assigned as views of the instantaneous potentials and uptimes, which
+    are progressed for all wells at once according to the choke positions found during the constrained optimization.
+    """
+    def __init__(self, wells, i):
+        profiles = [well.profiles[i] for well in wells]
+
+        self.index = 0  # time-index
+
+        # instantaneous potentials and uptimes, shared with the profiles
+        self.instantaneous = np.stack([profile.values for profile in profiles])
+        self.uptimes = np.stack([profile.uptimes for profile in profiles])
 
-        self.index = 0                    # time-index
-        self.potentials = profile.copy()  # unconstrained potentials
-        self.instantaneous = profile      # instantaneous potentials
+        for k, profile in enumerate(profiles):
+            profile.values = self.instantaneous[k, ...]
+            profile.uptimes = self.uptimes[k, ...]
 
-        # calculate here to avoid recalculation at each progression
-        self.cumulatives = np.vstack((profile.oil_cumulative(),
-                                      profile.gas_injection_cumulative(),
-                                      profile.water_injection_cumulative())).T
+        self._profiles = profiles
 
-        # trackers for the cumulative progress of produced/injected fluids
-        # col index     0            1             2
-        # values = [oil_cumulative, gas_injection_cumulative, water_injection_cumulative]
-        # units          MMstb                Bscf                       Bscf
-        self.tracker = np.zeros(3)
+        # groups of wells progressed alike: producers, gas injectors and water injectors
+        self._groups = []
 
-        # progression of the tracker can be optimized by storing the previously used index for the closest cumulative
-        # in potentials. This avoids the need for binary search during interpolation.
-        self.tracker_index = [0, 0, 0]
+        for indices in (PRODUCTION, GAS_INJECTION, WATER_INJECTION):
+            rows = np.asarray([k for k, well in enumerate(wells) if well.progression() == indices], dtype=np.int64)
 
-    def _progress(self, choke, dt, idt, idu, idp):
+            if rows.size:
+                self._groups.append(_PerformanceGroup(rows, profiles, self.instantaneous, *indices))
+
+    def current(self):
+        # instantaneous potentials of all wells at the current time-step, shape (wells, 6)
+        return self.instantaneous[:, self.index, :]
+
+    def progress(self, chokes, dt):
         """
-        Progress the performance table according to the choke position found during the constrained optimization.
+        Progress the performance of all wells according to the choke positions
 
         Parameters
         ----------
-        choke : float
-            choke position in [0, 1]
+        chokes : array_like
+            choke position of each well in [0, 1]
         dt : float
             time-step size
-        idt : int
-            index of tracker, 0=production, 1=gas injection, 2=water injection
-        idu : int/tuple
-            indexes of uptimes, production=(0, 1), gas injection=2, water injection=3
-        idp : int/tuple
-            indexes of instantaneous potentials, production=(0, 1, 2, 3), gas injection=4, water injection=5
         """
+        chokes = np.asarray(chokes, dtype=np.float64)
 
-        # progress the tracker
-        idi = idp[0] if isinstance(idp, tuple) else idp
-        self.tracker[idt] += self.instantaneous.values[self.index, idi] * dt * choke / 1e3
+        for group in self._groups:
+            group.progress(self.instantaneous, self.uptimes, self.index, chokes[group.rows], dt)
+
+        for profile in self._profiles:
+            profile.modified()
 
-        # assign uptimes values to the sample profile based on the choke
-        self.instantaneous.uptimes[self.index, idu] = choke
         self.index += 1
 
-        # update the instantaneous potentials via interpolation
-        try:
-            self._progress_tracker_index(idt)
+        # update the instantaneous potentials via interpolation, unless past the last time-step
+        if self.index < self.instantaneous.shape[1]:
+            for group in self._groups:
+                group.interpolate(self.instantaneous, self.index)
 
-            t = self.tracker_index[idt]
-            den = self.cumulatives[t + 1, idt] - self.cumulatives[t, idt]
-            nom = self.potentials.values[t + 1, idp] - self.potentials.values[t, idp]
-            a = nom / den
-            b = self.potentials.values[t, idp]
-            x = self.tracker[idt] - self.cumulatives[t, idt]
 
-            self.instantaneous.values[self.index, idp] = b + a * x
+class _PerformanceGroup:
+    """
+    Wells of a FieldPerformanceTable sharing tracker, uptime and potential indices, see FieldPerformanceTable.progress
+    """
+    def __init__(self, rows, profiles, instantaneous, idt, idu, idp):
+        """
+        Parameters
+        ----------
+        idt : int
+            index of tracker, 0=production, 1=gas injection, 2=water injection
+        idu : tuple
+            indexes of uptimes, production=(0, 1), gas injection=(2,), water injection=(3,)
+        idp : tuple
+            indexes of instantaneous potentials, production=(0, 1, 2, 3), gas injection=(4,), water injection=(5,)
+        """
+        self.rows = rows
+        self._idu = np.asarray(idu)
+        self._idp = np.asarray(idp)
 
-        except IndexError:
+        # unconstrained potentials and their cumulatives, calculated here to avoid recalculation at each progression
+        self._potentials = instantaneous[rows[:, None], :, self._idp].transpose(0, 2, 1).copy()
+        self._cumulatives = np.stack([getattr(profiles[k], _TRACKED_CUMULATIVES[idt])() for k in rows])
 
-            pass
+        # tracker for the cumulative progress of produced/injected fluids, and the index of the closest cumulative in
+        # potentials below the tracker, which only moves forward in time
+        self._tracker = np.zeros(rows.size)
+        self._tracker_index = np.zeros(rows.size, dtype=np.int64)
 
-    def progress_production(self, choke, dt):
-        self._progress(choke, dt, 0, (0, 1), (0, 1, 2, 3))
+    def progress(self, instantaneous, uptimes, index, chokes, dt):
+        # progress the tracker
+        self._tracker += instantaneous[self.rows, index, self._idp[0]] * dt * chokes / 1e3
 
-    def progress_gas_injection(self, choke, dt):
-        self._progress(choke, dt, 1, 2, 4)
+        # assign uptimes values to the sample profile based on the choke
+        uptimes[self.rows[:, None], index, self._idu] = chokes[:, None]
 
-    def progress_water_injection(self, choke, dt):
-        self._progress(choke, dt, 2, 3, 5)
+    def interpolate(self, instantaneous, index):
+        n = self._cumulatives.shape[1]
+        rows = np.arange(self.rows.size)
 
-    def _progress_tracker_index(self, idt):
         # progress the tracker index
+        while True:
+            next_ = self._tracker_index + 1
+            advance = next_ < n
+            advance[advance] = self._cumulatives[rows[advance], next_[advance]] < self._tracker[advance]
 
-        found = False
+            if not advance.any():
+                break
 
-        while not found:
+            self._tracker_index[advance] += 1
 
-            try:
-                cum = self.cumulatives[self.tracker_index[idt] + 1, idt]
-            except IndexError:
-                raise  # last index reached
+        # interpolate all wells with a tracker within the tabulated cumulatives
+        rows = rows[self._tracker_index + 1 < n]
+        t = self._tracker_index[rows]
 
-            if cum < self.tracker[idt]:
-                self.tracker_index[idt] += 1
-            else:
-                found = True
+        with np.errstate(divide='ignore', invalid='ignore'):
+            den = self._cumulatives[rows, t + 1] - self._cumulatives[rows, t]
+            nom = self._potentials[rows, t + 1, :] - self._potentials[rows, t, :]
+            a = nom / den[:, None]
+            b = self._potentials[rows, t, :]
+            x = self._tracker[rows] - self._cumulatives[rows, t]
+
+            instantaneous[self.rows[rows, None], index, self._idp] = b + a * x[:, None]
+
+
+class PerformanceTable:
+    """
+    View of a single well in a FieldPerformanceTable
+    """
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def current(self):
+        return self._table.instantaneous[self._row, self._table.index, :]
 
     def production(self):
-        values = self.instantaneous.values[self.index, :]
+        values = self.current()
         return values[0], values[1] - values[3], values[2]
 
     def injection(self):
-        return self.instantaneous.values[self.index, 4:]
+        return self.current()[4:]
 
     def oil(self):
-        return self.instantaneous.values[self.index, 0]
+        return self.current()[0]
 
     def total_gas(self):
-        return self.instantaneous.values[self.index, 1]
+        return self.current()[1]
 
     def water(self):
-        return self.instantaneous.values[self.index, 2]
+        return self.current()[2]
 
     def lift_gas(self):
-        return self.instantaneous.values[self.index, 3]
+        return self.current()[3]
 
     def gas_injection(self):
-        return self.instantaneous.values[self.index, 4]
+        return self.current()[4]
 
     def water_injection(self):
-        return self.instantaneous.values[self.index, 5]
+        return self.current()[5]
+
+
+# progression indices (tracker, uptimes, potentials) of the performance table
+PRODUCTION = (0, (0, 1), (0, 1, 2, 3))
+GAS_INJECTION = (1, (2,), (4,))
+WATER_INJECTION = (2, (3,), (5,))
+
+# cumulatives tracked by each tracker
+_TRACKED_CUMULATIVES = ('oil_cumulative', 'gas_injection_cumulative', 'water_injection_cumulative')
+
+
+# ======================================================================================================================
+# Simulation cache
+# ======================================================================================================================
+class SimulationCache:
+    """
+    Cache of simulated production potentials, allowing subsequent runs to re-use the potentials of producers whose
+    fingerprinted inputs are unchanged. The cache is only held in memory and is emptied when pickled. Potentials are
+    held up to a number of bytes and correlation factors up to a number of factors, evicting the least recently used.
+    """
+    def __init__(self, size=_CACHE_SIZE, factors=_CACHE_FACTORS):
+        self._size = size          # int, maximum number of bytes of the cached potentials
+        self._n_factors = factors  # int, maximum number of cached correlation factors
+
+        self._entries = OrderedDict()  # {(prediction_id, producer_id): (fingerprint, values)}, least recent first
+        self._factors = OrderedDict()  # {fingerprint: factor}, least recent first
+        self._bytes = 0                # int, number of bytes of the cached potentials
+
+    def __getstate__(self):
+        return {'_size': self._size, '_n_factors': self._n_factors}
+
+    def __setstate__(self, state):
+        # caches pickled before the bounds were introduced hold no bounds
+        self.__init__(state.get('_size', _CACHE_SIZE), state.get('_n_factors', _CACHE_FACTORS))
+
+    # front-end code ---------------------------------------------------------------------------------------------------
+    def Clear(self):
+        self._entries = OrderedDict()
+        self._factors = OrderedDict()
+        self._bytes = 0
+
+    def Retain(self, predictions, producers):
+        """
+        Evicts the potentials of predictions and producers which no longer exist
+
+        Parameters
+        ----------
+        predictions : iterable
+            Ids of the existing predictions
+        producers : iterable
+            Ids of the existing producers
+        """
+
+        predictions = set(predictions)
+        producers = set(producers)
+
+        for key in [key for key in self._entries if (key[0] not in predictions) or (key[1] not in producers)]:
+            self._evict(key)
+
+    # back-end code ----------------------------------------------------------------------------------------------------
+    def get(self, key, fingerprint):
+        # cached potentials are returned as the read-only array held by the cache
+        if fingerprint is None or key not in self._entries:
+            return None
+
+        fingerprint_, values = self._entries[key]
+
+        if fingerprint_ != fingerprint:
+            return None
+
+        self._entries.move_to_end(key)
+        return values
+
+    def set(self, key, fingerprint, values):
+        if key in self._entries:
+            self._evict(key)
+
+        if (fingerprint is None) or (values.nbytes > self._size):
+            return
+
+        values = values.copy()
+        values.flags.writeable = False
+
+        self._entries[key] = (fingerprint, values)
+        self._bytes += values.nbytes
+
+        while self._bytes > self._size:
+            self._evict(next(iter(self._entries)))
+
+    def factor(self, rho):
+        # factor of a correlation matrix, re-used until the matrix changes
+        rho = np.asarray(rho, dtype=np.float64)
+        fingerprint = (rho.shape, rho.tobytes())
+
+        if fingerprint not in self._factors:
+            self._factors[fingerprint] = correlation_factor(rho)
+
+            if len(self._factors) > self._n_factors:
+                self._factors.popitem(last=False)
+
+        self._factors.move_to_end(fingerprint)
+        return self._factors[fingerprint]
+
+    def _evict(self, key):
+        _, values = self._entries.pop(key)
+        self._bytes -= values.nbytes
+
+
+# ======================================================================================================================
+# Network linear program
+# ======================================================================================================================
+class SparsePattern:
+    """
+    Fixed sparsity pattern of a matrix assembled from (row, col, value) entries. The pattern is compressed once, after
+    which a CSR matrix is assembled from the entry values alone. Duplicate entries are summed.
+    """
+    def __init__(self, rows, cols, shape):
+        self.shape = shape
+
+        keys = np.asarray(rows, dtype=np.int64) * shape[1] + np.asarray(cols, dtype=np.int64)
+        unique, self._slots = np.unique(keys, return_inverse=True)
+
+        self._indices = unique % shape[1]
+        self._indptr = np.searchsorted(unique // shape[1], np.arange(shape[0] + 1))
+
+    def matrix(self, values):
+        data = np.bincount(self._slots, weights=values, minlength=self._indices.size)
+        return csr_matrix((data, self._indices, self._indptr), shape=self.shape)
+
+
+class NetworkProgram:
+    """
+    Linear program solving the choke positions of all wells subject to voidage replacement and network constraints.
+    The network is fixed for a simulation run, so the sparsity pattern of the constraint matrices and the right hand
+    sides are assembled once, and only the coefficients are updated at each time-step.
+    """
+    def __init__(self, producers, injectors, network, well_map, availability):
+        self._producers = producers
+        self._injectors = injectors
+
+        p = len(producers)
+        w = p + len(injectors)
+
+        # equality constraints, voidage replacement of producers supported by injectors --------------------------------
+        # row per supported producer, with the producer's reservoir volume and the injectors' injection volumes
+        self._supported = sorted({index for injector in injectors for index in injector.producer_map.values()})
+        row_map = {index: row for row, index in enumerate(self._supported)}
+
+        rows = list(range(len(self._supported)))
+        cols = list(self._supported)
+
+        for j, injector in enumerate(injectors):
+            for index in injector.producer_map.values():
+                rows.append(row_map[index])
+                cols.append(p + j)
+
+        self._eq = SparsePattern(rows, cols, (len(self._supported), w))
+        self._b_eq = np.zeros(len(self._supported))
+
+        # inequality constraints, network constraints ------------------------------------------------------------------
+        # static stream-fraction tensor in coordinate form, one row of phase fractions for each non-zero coefficient
+        # (constraint row, well), such that the coefficient is the fractions contracted with the well's performance
+        fractions = []
+        rows = []
+        cols = []
+        b_iq = []
+
+        for e in network:
+            for con in e.active_constraints:
+
+                for well_id in e.active_wells:
+                    fractions.append(e.stream_fractions(con, well_id))
+                    rows.append(len(b_iq))
+                    cols.append(well_map[well_id])
+
+                b_iq.append(e.constraints[con] * availability)
+
+        self._fractions = np.reshape(fractions, (len(rows), 6))
+        self._cols = np.asarray(cols, dtype=np.int64)
+        self._iq = SparsePattern(rows, cols, (len(b_iq), w))
+        self._b_iq = np.asarray(b_iq, dtype=np.float64)
+
+        self._bounds = (0., availability)
+        self._upper = np.full(w, availability)
+
+    def solve(self, objective, table):
+        """
+        Solve the choke positions of the current time-step
+        :param objective: array, objective coefficients (negative oil potential of each well)
+        :param table: class FieldPerformanceTable()
+        :return: array, choke of each well
+        """
+        A_eq = self._equality_constraints()
+        A_iq = self._inequality_constraints(table)
+
+        # the objective coefficients are non-positive, so if fully open chokes are feasible, they are optimal. Fully
+        # open injectors are also the maximum injection, as allocated by the linear program below
+        if self._is_feasible(self._upper, A_eq, A_iq):
+            return self._upper
+
+        result = linprog(objective,
+                         A_ub=A_iq if A_iq.shape[0] else None, b_ub=self._b_iq if A_iq.shape[0] else None,
+                         A_eq=A_eq if A_eq.shape[0] else None, b_eq=self._b_eq if A_eq.shape[0] else None,
+                         bounds=self._bounds, method='highs')
+
+        if not result.success:
+            raise ConvergenceError(result.message)
+
+        return self._maximize_injection(result.x, A_eq, A_iq)
+
+    def _maximize_injection(self, x, A_eq, A_iq):
+        """
+        Injectors do not contribute to the objective, so their chokes are not unique in the optimum. Of the optimal
+        solutions, the injector chokes are maximized with the producer chokes fixed, such that injectors are allocated
+        consistently, whether or not fully open chokes are feasible
+        :param x: array, optimal choke of each well
+        :param A_eq: csr_matrix, equality constraints
+        :param A_iq: csr_matrix, inequality constraints
+        :return: array, choke of each well
+        """
+        p = len(self._producers)
+
+        if x.size == p:
+            return x
+
+        result = linprog(-np.ones(x.size - p),
+                         A_ub=A_iq[:, p:] if A_iq.shape[0] else None,
+                         b_ub=self._b_iq - A_iq[:, :p].dot(x[:p]) if A_iq.shape[0] else None,
+                         A_eq=A_eq[:, p:] if A_eq.shape[0] else None,
+                         b_eq=self._b_eq - A_eq[:, :p].dot(x[:p]) if A_eq.shape[0] else None,
+                         bounds=self._bounds, method='highs')
+
+        # the optimum is feasible, hence only numerical issues can fail the allocation, which then keeps the optimum
+        if result.success:
+            x = np.concatenate((x[:p], result.x))
+
+        return x
+
+    def _equality_constraints(self):
+        values = [self._producers[index].reservoir_volume() for index in self._supported]
+
+        for injector in self._injectors:
+            values += [volume for volume, _ in injector.injection_volume()]
+
+        return self._eq.matrix(np.asarray(values, dtype=np.float64))
+
+    def _inequality_constraints(self, table):
+        performance = table.current()
+        values = np.einsum('ep,ep->e', self._fractions, performance[self._cols, :])
+
+        return self._iq.matrix(values)
+
+    def _is_feasible(self, x, A_eq, A_iq, tol=1e-9):
+        if A_iq.shape[0] and np.any(A_iq.dot(x) > self._b_iq + tol * np.maximum(np.abs(self._b_iq), 1.)):
+            return False
+
+        if A_eq.shape[0] and np.any(np.abs(A_eq.dot(x) - self._b_eq) > tol * np.maximum(abs(A_eq).dot(x), 1.)):
+            return False
+
+        return True
 
 
 # ======================================================================================================================
@@ -240,32 +579,23 @@ class SimulationEntity:
         self.active_constraints = [id_ for id_, value in self.constraints.items() if value is not None]
 
     def network_coefficient(self, phase_id, well):
-        stream = 0.
-
-        if phase_id == ID_OIL_NW:
-            stream = well.performance.oil() * self.streams_nw[well.id][phase_id]
-
-        elif phase_id == ID_GAS_NW:
-            stream = well.performance.total_gas() * self.streams_nw[well.id][phase_id]
-
-        elif phase_id == ID_WATER_NW:
-            stream = well.performance.water() * self.streams_nw[well.id][phase_id]
-
-        elif phase_id == ID_LIQUID_NW:
-            oil = well.performance.oil() * self.streams_nw[well.id][ID_OIL_NW]
-            water = well.performance.water() * self.streams_nw[well.id][ID_WATER_NW]
-            stream = oil + water
+        return np.dot(self.stream_fractions(phase_id, well.id), well.performance.current())
 
-        elif phase_id == ID_INJ_GAS_NW:
-            stream = well.performance.gas_injection() * self.streams_nw[well.id][phase_id]
-
-        elif phase_id == ID_INJ_WATER_NW:
-            stream = well.performance.water_injection() * self.streams_nw[well.id][phase_id]
+    def stream_fractions(self, phase_id, well_id):
+        """
+        Fractions of a well's performance values [oil, total_gas, water, lift_gas, gas_inj, water_inj] flowing through
+        the entity and counting towards the constraint of a network phase
+        :param phase_id: ID_PHASE_NW of the constraint
+        :param well_id: id of the well
+        :return: array (6,)
+        """
+        fractions = np.zeros(6)
+        streams = self.streams_nw[well_id]
 
-        elif phase_id == ID_LIFT_GAS_NW:
-            stream = well.performance.lift_gas() * self.streams_nw[well.id][phase_id]
+        for column, stream_id in _PHASE_COLUMNS.get(phase_id, ()):
+            fractions[column] = streams.get(stream_id, 0.)
 
-        return stream
+        return fractions
 
 
 class ProducerSimulation(SimulationEntity):
@@ -371,21 +701,31 @@ class ProducerSimulation(SimulationEntity):
 
         return function, typecurve
 
+    def fingerprint_inputs(self):
+        # inputs determining the simulated potentials, see PredictionCase._fingerprint
+        return (self.fluids, self.ttglr, self.spacing, self.statics, self.statics_unc, self.scalers.get(),
+                self.scalers_unc, self.scaling, self._functions, self._typecurves, self._occurrences)
+
+    def get_typecurves(self):
+        return [id_ for id_ in self._typecurves if id_ is not None]
+
     def reservoir_volume(self):
         bo, bg, bw, rs = self.fluids
         oil, gas, water = self.performance.production()
-        return oil * (bo + max(gas / oil - rs, 0.) * bg) + water * bw
+        gor = gas / oil if oil else 0.
+        return oil * (bo + max(gor - rs, 0.) * bg) + water * bw
 
     def prepare_network(self):
         self.active_wells = [self.id]
 
         self.streams_nw[self.id] = {ID_OIL_NW: 1., ID_GAS_NW: 1., ID_WATER_NW: 1., ID_LIFT_GAS_NW: 1.}
 
-    def assign_performance(self, i):
-        self.performance = PerformanceTable(self.profiles[i])
+    def assign_performance(self, table, row):
+        self.performance = PerformanceTable(table, row)
 
-    def progress_performance(self, choke, dt):
-        self.performance.progress_production(choke, dt)
+    @staticmethod
+    def progression():
+        return PRODUCTION
 
 
 class InjectorSimulation(SimulationEntity):
@@ -422,8 +762,8 @@ class InjectorSimulation(SimulationEntity):
 
         return array
 
-    def assign_performance(self, i):
-        self.performance = PerformanceTable(self.profiles[i])
+    def assign_performance(self, table, row):
+        self.performance = PerformanceTable(table, row)
 
     def prepare_network(self):
         self.active_wells = [self.id]
@@ -431,19 +771,19 @@ class InjectorSimulation(SimulationEntity):
         self.streams_nw[self.id] = {ID_INJ_GAS_NW: 1.}
         self.streams_nw[self.id] = {ID_INJ_WATER_NW: 1.}
 
-    def progress_performance(self, choke, dt):
+    def progression(self):
 
         if self.phase == ID_GAS_INJ:
 
-            self.performance.progress_gas_injection(choke, dt)
+            return GAS_INJECTION
 
         elif self.phase == ID_WATER_INJ:
 
-            self.performance.progress_water_injection(choke, dt)
+            return WATER_INJECTION
 
         else:  # WAG
 
-            pass
+            return None
 
 
 class ProcessorSimulation(SimulationEntity):
@@ -485,6 +825,10 @@ class TypecurveSimulation(SimulationEntity):
         # functions: liquid_potential, oil_cut and gas_oil_ratio with .eval(x) methods
         self.functions = None
 
+    def fingerprint_inputs(self):
+        # inputs determining the potentials of producers using the typecurve, see PredictionCase._fingerprint
+        return self.spacing, self.statics, self.statics_unc, self.functions
+
 
 # ======================================================================================================================
 # Simulation cases (history & prediction)
@@ -504,6 +848,7 @@ class SimulationCase:
         # number of samples
         self._samples = 1
         self._save_all = False
+        self._compact = False
 
         # timeline
         self._frequency, self._delta = properties.timeline.get()
@@ -535,6 +880,9 @@ class SimulationCase:
     def GetWells(self):
         return self._get_wells()
 
+    def CompactProfiles(self):
+        return self._compact
+
     def KeepAllProfiles(self):
         return self._save_all
 
@@ -684,25 +1032,27 @@ class SimulationCase:
         save_all = self._save_all
         weights = np.full(len(extraction), 1. / len(extraction))
 
+        # summaries are compiled once and evaluated on all samples at once
+        evaluator = SummaryEvaluator(summaries)
+
         # calculate producer summaries
-        for prod in self._producers.values():
-            try:
-                prod.summaries = [{s.GetId(): s.Calculate(prod.profiles[i], prod.GetPropertyMap()) for s in summaries}
-                                  for i in range(self._samples)]
+        ensembles = {}
 
-            except NameError:
-                raise
+        for prod in self._producers.values():
+            ensembles[prod.id] = Ensemble.stack(prod.profiles)
+            prod.summaries = evaluator.evaluate(ensembles[prod.id], prod.GetPropertyMap())
 
         # pre-allocate injector summaries
         for inj in self._injectors.values():
-            inj.summaries = [{s.GetId(): 0. for s in summaries} for _ in range(self._samples)]
+            inj.summaries = SummaryTable([s.GetId() for s in summaries], self._samples)
 
         # extract representative realizations for each producer
         for prod in self._producers.values():
 
             lmh = extract_realizations(prod.summaries, extraction, weights, cases)
 
-            prod.simulation = SimulationResult(lmh, prod.profiles, prod.summaries, shading=save_all, finalized=True)
+            prod.simulation = SimulationResult(lmh, ensembles[prod.id], prod.summaries, shading=save_all,
+                                               finalized=True)
 
         for inj in self._injectors.values():
 
@@ -745,119 +1095,69 @@ class SimulationCase:
         # calculate summaries for all equipment and extract LMH
         for e in self._get_equipment():
 
-            e.summaries = [{summary.GetId(): 0. for summary in summaries} for _ in range(self._samples)]
-
-            for i in range(self._samples):
-                for summary in summaries:
-                    try:
-                        e.summaries[i][summary.GetId()] = summary.Calculate(e.profiles[i], {})
-
-                    except NameError:
-                        pass
+            ensemble = Ensemble.stack(e.profiles)
+            e.summaries = evaluator.evaluate(ensemble, {}, ignore_undefined=True)
 
             lmh = extract_realizations(e.summaries, extraction, weights, cases)
-            e.simulation = SimulationResult(lmh, e.profiles, e.summaries, shading=save_all, finalized=True)
+            e.simulation = SimulationResult(lmh, ensemble, e.summaries, shading=save_all, finalized=True)
 
     @staticmethod
-    def _simulate_gas_lift_potential(profile, ttglr):
+    def _simulate_gas_lift_potential(values, ttglr):
+        # values is the (time, 6) value array of a Profile
         if ttglr is not None:
-            profile.values[:, 1] -= profile.values[:, 3]  # remove gas-lift from total gas
-            profile.values[:, 3] = np.clip(ttglr * profile.liquid_potential() - profile.values[:, 1], 0., None)
-            profile.values[:, 1] += profile.values[:, 3]
-
-    def _equality_constraints(self):
-        wells = self._get_wells()
-        w = len(wells)
-        p = len(self._producers)
-
-        A_eq = np.zeros((p, w))
-
-        for j, producer in enumerate(self._producers.values()):
-            A_eq[j, j] = producer.reservoir_volume()
-
-        for j, injector in enumerate(self._injectors.values()):
-            volumes = injector.injection_volume()
-
-            for volume, index in volumes:
-                A_eq[index, p + j] = volume
-
-        return A_eq, np.zeros((p, 1))
-
-    def _inequality_constraints(self):
-        n_con = np.sum([len(e.active_constraints) for e in self._get_network()])
-        n_well = len(self._get_wells())
-
-        A_iq = np.zeros((n_con, n_well))
-        b_iq = np.zeros((n_con, 1))
-
-        wells = {**self._producers, **self._injectors}
-
-        count = 0
-        for e in self._get_network():
-
-            for con in e.active_constraints:
-
-                for w in e.active_wells:
-
-                    sys_idx = self._well_map[w]  # TODO: store smarter. Perhaps store in e.active_wells
-                    well = wells[w]
-
-                    A_iq[count, sys_idx] += e.network_coefficient(con, well)
-
-                b_iq[count, 0] = e.constraints[con] * self._availability
-
-                count += 1
+            values[:, 1] -= values[:, 3]  # remove gas-lift from total gas
+            values[:, 3] = np.clip(ttglr * (values[:, 0] + values[:, 2]) - values[:, 1], 0., None)
+            values[:, 1] += values[:, 3]
 
-        return A_iq, b_iq
-
-    def _bounds(self):
-        return [(0., self._availability) for _ in self._get_wells()]
-
-    def _objective_function(self, i, t):
+    @staticmethod
+    def _objective_function(table, t):
         # optimize the oil rates in each time_step (negative to convert from min to max)
-        return [-w.profiles[i].values[t, 0] for w in self._get_wells()]
-
-    def _progress_performance(self, chokes, dt):
-        for j, well in enumerate(self._get_wells()):
-            well.progress_performance(chokes[j], dt)
+        return -table.instantaneous[:, t, 0]
 
     def _assign_performance(self, i):
-        for well in self._get_wells():
-            well.assign_performance(i)
+        wells = self._get_wells()
+        table = FieldPerformanceTable(wells, i)
 
-    def _simulate_rates(self):
+        for j, well in enumerate(wells):
+            well.assign_performance(table, j)
+
+        return table
+
+    def _simulate_rates(self, hook=None):
+        """
+        Simulates the constrained rates of each sample
+        :param hook: function, called with the range of each block of samples whose rates are completed, or None
+        """
         self._assemble_system_network()
 
-        bounds = self._bounds()
+        program = NetworkProgram(list(self._producers.values()), list(self._injectors.values()),
+                                 self._get_network(), self._well_map, self._availability)
+
         dt = self._timeline[1:] - self._timeline[:-1]
+        a = 0
 
         for i in range(self._samples):
 
-            self._assign_performance(i)
+            table = self._assign_performance(i)
 
             for t, _ in enumerate(self._timeline):
 
-                g = self._objective_function(i, t)
-
-                A_eq, b_eq = self._equality_constraints()
-                A_iq, b_iq = self._inequality_constraints()
-                #print(A_eq)
-                #print(A_iq)
-                #print(b_iq)
-
-                if b_eq.size or b_eq.size:
-                    chokes = linprog(g, A_ub=A_iq, b_ub=b_iq,A_eq=A_eq, b_eq=b_eq, bounds=bounds)
-                else:
-                    chokes = np.repeat(self._availability, (len(self._get_wells()), 1))
-
-                print(self._dateline[t], np.round(chokes.x, 4))
+                try:
+                    chokes = program.solve(self._objective_function(table, t), table)
+                except ConvergenceError as e:
+                    raise ConvergenceError('Unable to solve constrained rates at {}: {}'.format(self._dateline[t],
+                                                                                                str(e)))
 
                 try:
                     dt_ = dt[t]
                 except IndexError:
                     dt_ = 0.  # last time-step, dt irrelevant.
 
-                self._progress_performance(chokes.x, dt_)
+                table.progress(chokes, dt_)
+
+            if (hook is not None) and ((i + 1 - a == _ADAPTIVE_BLOCK) or (i + 1 == self._samples)):
+                hook(range(a, i + 1))
+                a = i + 1
 
     def _simulate_injection_potential(self, injector, samples=()):
 
@@ -1034,7 +1334,7 @@ class HistoryCase(SimulationCase):
         profile = history.resample(self._dateline)
 
         # calculate lift-gas requirements ------------------------------------------------------------------------------
-        self._simulate_gas_lift_potential(profile, producer.ttglr)
+        self._simulate_gas_lift_potential(profile.values, producer.ttglr)
 
         return profile
 
@@ -1050,17 +1350,72 @@ class PredictionCase(SimulationCase):
         self._availability, self._constrained = properties.constrained.get()
 
         # sampling
-        self._samples, self._save_all = properties.sampling.get()
+        self._samples, self._save_all, self._processes, self._seed, self._tolerance, self._method, self._compact, \
+            self._tabulation = properties.sampling.get()
+
+        # extraction summaries and L/M/H percentiles of which the convergence is tracked by adaptive sampling
+        self._convergence = None
+        self._cases = None
+
+        # tabulated water-cut functions, {id(function): TabulatedFunction}
+        self._tables = {}
+
+        # cache of production potentials from previous runs, {(cache_id, producer_id): (fingerprint, values)}
+        self._cache = None
+        self._cache_id = None
+
+        # stochastic stability tracked while running, with a function called with its history after each block
+        self._stability_variables = None
+        self._stability_callback = None
+        self._stability = None
+
+    def __getstate__(self):
+        # the compiled extraction summaries and the stability tracking are only evaluated in the main process
+        state = self.__dict__.copy()
+        state['_convergence'] = None
+        state['_stability_callback'] = None
+        state['_stability'] = None
+        return state
 
     # front-end code ---------------------------------------------------------------------------------------------------
     def CalculateStability(self, variables):
+        if (self._stability is not None) and (self._stability_variables == variables):
+            if self._samples < 2:
+                return
+
+            # statistical properties as a function of sample size, excluding the full sample size
+            return self._stability.history()[:-1, :, :]
+
         return self._stochastic_stability(variables)
 
+    def SetCache(self, cache, id_):
+        self._cache = cache
+        self._cache_id = id_
+
+    def SetConvergence(self, summaries, settings):
+        extraction = settings.GetExtraction()
+
+        self._convergence = SummaryEvaluator([s for s in summaries if s.GetId() in extraction])
+        self._cases = settings.GetCases(False)
+
     def Run(self, rho_v, rho_e):
+        self._stability = None
+        if self._stability_variables is not None:
+            self._stability = RunningStatistics(len(self._stability_variables))
+
         self._simulate_potentials(rho_v, rho_e)
 
         if self._constrained:
-            self._simulate_rates()
+            self._simulate_rates(self._track_stability)
+
+    def SetStability(self, variables, callback=None):
+        """
+        Tracks the stochastic stability while running, fed as each block of samples completes
+        :param variables: tuple, (oil rate, oil cumulative, water-cut, GOR) variables
+        :param callback: function, called with the history (samples, 4, 2) of the stability after each block, or None
+        """
+        self._stability_variables = variables
+        self._stability_callback = callback
 
     # external methods -------------------------------------------------------------------------------------------------
     # internal methods -------------------------------------------------------------------------------------------------
@@ -1092,38 +1447,71 @@ class PredictionCase(SimulationCase):
 
         return sample
 
-    def _sample_function_uncertainty(self, rho_e):
-        return stnormal2stuniform(np.random.multivariate_normal(np.zeros(len(rho_e)), rho_e, self._samples))
+    def _correlation_factor(self, rho):
+        if self._cache is None:
+            return correlation_factor(rho)
+
+        return self._cache.factor(rho)
+
+    def _sample_function_uncertainty(self, rho_e, z):
+        """
+        Sample correlated function uncertainty of each polygon
+        :param rho_e: correlation matrix between polygons
+        :param z: independent standard normal samples, shape (samples, polygons)
+        :return: array of standard uniform samples, shape (samples, polygons)
+        """
+        return stnormal2stuniform(z @ self._correlation_factor(rho_e).T)
 
     @staticmethod
-    def _sample_scalers(prod, sample, x, idx):
+    def _assign_scalers(prod, sample, scalers, idx):
+        """
+        Assigned or defaulted scalers of a sample, overwritten by the scalers sampled with uncertainty
+        :param prod: class ProducerSimulation()
+        :param sample: list of 6 scalers evaluated from statics, or None
+        :param scalers: list of 6 arrays (samples,) sampled by _sample_scalers, or None
+        :param idx: sample index
+        :return: list of 6 scalers
+        """
+        sample = prod.scalers.assign(sample)
+
+        for i, scaler in enumerate(scalers):
+            if scaler is not None:
+                sample[i] = scaler[idx]
+
+        return sample
 
+    @staticmethod
+    def _sample_scalers(prod, x):
+        """
+        Sample the scalers of a producer with uncertainty, for all samples at once
+        :param prod: class ProducerSimulation()
+        :param x: sampled static uncertainty matrix, shape (polygons, variables, samples)
+        :return: list of 6 arrays (samples,) of sampled scalers, None if the scaler is not assigned
+        """
         scalers = prod.scalers.get()
         scalers_unc = prod.scalers_unc
 
         # sampled uncertainty parameters for the associated polygon
-        x_scaler = x[prod.polygon_index, :len(scalers), idx]
+        x_scaler = x[prod.polygon_index, :len(scalers), :]
 
-        # extract assigned or defaulted scalers
-        sample = prod.scalers.assign(sample)
+        sample = [None for _ in scalers]
 
         for i, scaler in enumerate(scalers):
             if scaler is not None:
                 try:
-                    sample[i] = scalers_unc[i].sample(x_scaler[i], scaler)  # sample[i]
+                    sample[i] = np.broadcast_to(scalers_unc[i].sample(x_scaler[i, :], scaler), x.shape[2:])
                 except ValueError as e:
                     raise ValueError('Producer ({}) unable to sample uncertainty: {}'.format(prod.name, str(e)))
 
         return sample
 
     @staticmethod
-    def _sample_statics(entity, x, idx):
+    def _sample_statics(entity, x):
         """
-        Sample static parameters of either producer or typecurve, taking into account uncertainty
+        Sample static parameters of either producer or typecurve, taking into account uncertainty, for all samples
         :param entity: ProducerSimulation or TypecurveSimulation
-        :param x: sampled static uncertainty matrix
-        :param idx: sample index
-        :return:
+        :param x: sampled static uncertainty matrix, shape (polygons, variables, samples)
+        :return: list of static parameters, each an array (samples,) if sampled with uncertainty or else the static
         """
         # scalers and static parameters for the producer
         statics = entity.statics
@@ -1132,7 +1520,7 @@ class PredictionCase(SimulationCase):
         # sampled uncertainty parameters for the associated polygon
         if entity.polygon_id is not None:
 
-            x_static = x[entity.polygon_index, 6:, idx]  # 6 is number of scalers
+            x_static = x[entity.polygon_index, 6:, :]  # 6 is number of scalers
 
         else:  # typecurve is not associated to a polygon, thus unable to sample uncertainty
 
@@ -1140,57 +1528,144 @@ class PredictionCase(SimulationCase):
 
         try:
 
-            return [statics_unc[i].sample(x_static[i], statics[i]) for i in range(len(statics))]
+            return [statics_unc[i].sample(x_static[i, :], statics[i]) for i in range(len(statics))]
 
         except ValueError as e:
 
             raise ValueError('Entity ({}) unable to sample uncertainty: {}'.format(entity.name, str(e)))
 
-    def _sample_static_uncertainty(self, rho_v, rho_e):
-        v = len(rho_v)
-        e = len(rho_e)
-        n = v * e
-        rho_va = np.asarray(rho_v)
-        rho = np.zeros((n, n))
+    def _sample_static_uncertainty(self, rho_v, rho_e, z):
+        """
+        Sample correlated static uncertainty of each polygon and variable
+        :param rho_v: correlation matrix between variables
+        :param rho_e: correlation matrix between polygons
+        :param z: independent standard normal samples, shape (samples, polygons, variables)
+        :return: array of standard normal samples, shape (polygons, variables, samples)
+        """
+        # the correlation matrix rho_e (x) rho_v is factored by the Kronecker product of the factors of each
+        if not z.size:
+            return np.zeros((len(rho_e), len(rho_v), self._samples))
+
+        l_e = self._correlation_factor(rho_e)
+        l_v = self._correlation_factor(rho_v)
+
+        return np.einsum('ij,sjk,lk->ils', l_e, z, l_v, optimize=True)
+
+    def _sample_standard_normals(self, v):
+        """
+        Independent standard normal samples, drawn from a seeded random stream for each polygon and block of samples.
+        Hence a sample is reproducible irrespective of the number of samples, chunking and parallel execution.
+        :param v: number of static uncertainty variables
+        :return: array (samples, polygons, 1 + v), column 0 for function uncertainty and 1: for static uncertainty
+        """
+        if self._method in (ID_SAMPLING_LATIN_HYPERCUBE, ID_SAMPLING_SOBOL):
+            return self._sample_stratified_normals(v)
+
+        blocks = -(-self._samples // _SAMPLE_BLOCK)
+        z = np.zeros((blocks * _SAMPLE_BLOCK, len(self._polygons), 1 + v))
 
-        # assemble correlation matrix
-        for i in range(0, e):
-            for j in range(0, i + 1):
-                rho[i*v:(i+1)*v, j*v:(j+1)*v] = rho_e[i][j] * rho_va
+        for j, id_ in enumerate(self._polygons):
+            for b in range(blocks):
+                generator = np.random.default_rng(np.random.SeedSequence(self._seed, spawn_key=(id_, b)))
+                z[b * _SAMPLE_BLOCK:(b + 1) * _SAMPLE_BLOCK, j, :] = generator.standard_normal((_SAMPLE_BLOCK, 1 + v))
 
-        rho += rho.T
+        return z[:self._samples, :, :]
 
-        # sample standard normal random variables
-        x = np.random.multivariate_normal(np.zeros(n), rho, self._samples)
-        return np.reshape(x, (self._samples, v, e)).T
+    def _sample_stratified_normals(self, v):
+        """
+        Independent standard normal samples, by inverse-normal transform of a Latin hypercube or scrambled Sobol design
+        spanning all polygons and variables. Correlation is imposed afterwards as for random samples. Sobol points are
+        a prefix of a single sequence, Latin hypercube strata depend on the number of samples.
+        :param v: number of static uncertainty variables
+        :return: array (samples, polygons, 1 + v), column 0 for function uncertainty and 1: for static uncertainty
+        """
+        d = len(self._polygons) * (1 + v)
+
+        if not d:
+            return np.zeros((self._samples, 0, 1 + v))
+
+        generator = np.random.default_rng(self._seed)
+
+        if self._method == ID_SAMPLING_SOBOL:
+            # drawn as the balanced power of 2 points covering the samples
+            m = max(int(np.ceil(np.log2(self._samples))), 0)
+            u = qmc.Sobol(d, scramble=True, seed=generator).random_base2(m)[:self._samples, :]
+        else:
+            u = qmc.LatinHypercube(d, seed=generator).random(self._samples)
+
+        # a sample on the boundary of the unit hypercube would be transformed to an infinite value
+        u = np.clip(u, np.finfo(np.float64).tiny, 1. - np.finfo(np.float64).epsneg)
+
+        return ndtri(u).reshape(self._samples, len(self._polygons), 1 + v)
 
     def _simulate_potentials(self, rho_v, rho_e):
         # generate timeline --------------------------------------------------------------------------------------------
         self._generate_timeline()
 
         # sample uncertainty space -------------------------------------------------------------------------------------
-        xf = self._sample_function_uncertainty(rho_e)
-        xs = self._sample_static_uncertainty(rho_v, rho_e)
+        z = self._sample_standard_normals(len(rho_v))
+        xf = self._sample_function_uncertainty(rho_e, z[:, :, 0])
+        xs = self._sample_static_uncertainty(rho_v, rho_e, z[:, :, 1:])
 
-        for i in range(0, self._samples):
+        self._tables = {}
 
-            # simulate production potentials
-            for j, prod in enumerate(self._producers.values()):
+        # re-use cached potentials of producers with unchanged inputs --------------------------------------------------
+        potentials = {}         # {producer_id: array (samples, time, 6)}
+        fingerprints = {}       # {producer_id: str}
 
-                # sample function and potential typecurve id
-                functions, id_ = prod.sample_functions(xf, i)
+        if self._cache is not None:
+            adaptive = self._is_adaptive()
 
-                # transform samples into scalers parameters
-                if id_ is not None:
-                    typecurve = self._typecurves[id_]
-                else:
-                    typecurve = None
+            for id_, prod in self._producers.items():
+                fingerprints[id_] = self._fingerprint(prod, xf, xs)
+                values = self._cache.get((self._cache_id, id_), fingerprints[id_])
 
-                scalers = self._static_to_scalers(prod, typecurve, xs, i)
-                scalers = self._sample_scalers(prod, scalers, xs, i)
-                self._well_spacing_adjustment(prod, typecurve, scalers)
+                # potentials of an adaptive run stopped early are only continued by another adaptive run
+                if (values is not None) and (adaptive or (len(values) >= self._samples)):
+                    potentials[id_] = values
+
+        producers = [prod for id_, prod in self._producers.items() if id_ not in potentials]
+
+        # simulate production potentials, in parallel over chunks of samples if possible -------------------------------
+        simulated = {}  # {producer_id: array (samples, time, 6)}
+
+        for prod in self._producers.values():
+            prod.profiles = []
+
+        if self._is_adaptive() or (self._stability_callback is not None):
+            # profiles are created as each block of samples completes
+            simulated = self._simulate_block_potentials(potentials, xf, xs)
+
+        else:
+            if producers:
+                values = self._simulate_parallel_potentials(producers, xf, xs)
+
+                if values is None:
+                    values = self._simulate_production_chunk(producers, xf, xs)
 
-                profile = self._simulate_production_potential(prod, functions, scalers)
+                simulated = {prod.id: value for prod, value in zip(producers, values)}
+
+            potentials.update(simulated)
+            self._complete_samples({id_: values[:self._samples] for id_, values in potentials.items()},
+                                   0, self._samples)
+
+        for id_, values in simulated.items():
+            if self._cache is not None:
+                self._cache.set((self._cache_id, id_), fingerprints[id_], values)
+
+    def _complete_samples(self, potentials, a, b):
+        """
+        Creates the producer and injector profiles of a block of samples, from the production potentials of the block.
+        If the case is unconstrained, the profiles are final and the stochastic stability is fed with the block.
+        :param potentials: dict, {producer_id: array (samples, time, 6)} of the block
+        :param a: int, index of the first sample of the block
+        :param b: int, index after the last sample of the block
+        """
+        for prod in self._producers.values():
+            for value in potentials[prod.id]:
+                profile = Profile()
+                profile.allocate(self._dateline)
+                profile.values = value
 
                 # if producer has history, set cumulative offsets
                 if prod.history is not None:
@@ -1198,7 +1673,8 @@ class PredictionCase(SimulationCase):
 
                 prod.profiles.append(profile)
 
-            # simulate injection potentials
+        # simulate injection potentials --------------------------------------------------------------------------------
+        for i in range(a, b):
             for inj in self._injectors.values():
                 profile = self._simulate_injection_potential(inj, i)
 
@@ -1208,86 +1684,361 @@ class PredictionCase(SimulationCase):
 
                 inj.profiles.append(profile)
 
-    def _simulate_production_potential(self, producer, functions, scalers):
-        profile = Profile()
-        profile.allocate(self._dateline)
+        if not self._constrained:
+            self._track_stability(range(a, b))
 
-        # unpack variables and pre-allocate ----------------------------------------------------------------------------
-        if functions is not None:
-            liquid_potential, water_cut, gas_oil_ratio = functions
-        else:
-            return profile
+    def _track_stability(self, samples):
+        # per-block hook, feeding the running stochastic stability with a block of completed samples
+        if self._stability is None:
+            return
+
+        for values in self._stability_samples(self._stability_variables, samples):
+            self._stability.update(values)
+
+        if self._stability_callback is not None:
+            self._stability_callback(self._stability.history())
+
+    def _fingerprint(self, prod, xf, xs):
+        """
+        Fingerprint of everything determining the simulated potentials of a producer: its own inputs, the inputs of
+        its typecurves, the timeline and its rows of the sampled uncertainty matrices. Thereby changes to
+        typecurves, scalings, polygons and correlations are all tracked.
+        :param prod: class ProducerSimulation()
+        :param xf: sampled function uncertainty matrix
+        :param xs: sampled static uncertainty matrix
+        :return: str or None if the inputs can not be fingerprinted
+        """
+        typecurves = [self._typecurves[id_] for id_ in prod.get_typecurves()]
+        entities = [e for e in [prod] + typecurves if e.polygon_id is not None]
+
+        inputs = (self._dateline, self._samples, self._tabulation,
+                  prod.fingerprint_inputs(),
+                  [typecurve.fingerprint_inputs() for typecurve in typecurves],
+                  xf[:, prod.polygon_index],
+                  [xs[e.polygon_index, :, :] for e in entities])
+
+        try:
+
+            return hashlib.sha1(pickle.dumps(inputs, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+        except (pickle.PicklingError, AttributeError, TypeError):
+
+            return None
+
+    def _simulate_parallel_potentials(self, producers, xf, xs):
+        """
+        Splits the samples into one chunk per process and simulates the production potentials of each chunk in a
+        process pool. Uncertainty is sampled up-front, so the result is identical to the serial simulation.
+        :param producers: list of class ProducerSimulation()
+        :param xf: sampled function uncertainty matrix
+        :param xs: sampled static uncertainty matrix
+        :return: list of arrays (samples, time, 6), one per producer, or None if unable to run in parallel
+        """
+        chunks = [chunk for chunk in np.array_split(np.arange(xf.shape[0]), self._processes) if chunk.size]
+
+        if len(chunks) < 2:
+            return None
+
+        try:
+
+            case = pickle.dumps(self)
+
+        except (pickle.PicklingError, AttributeError, TypeError):  # e.g. functions containing local lambdas
+
+            return None
+
+        ids = [prod.id for prod in producers]
+
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(_simulate_production_chunk, case, ids, xf[chunk, :], xs[:, :, chunk])
+                       for chunk in chunks]
+
+            results = [future.result() for future in futures]
+
+        return [np.concatenate(values) for values in zip(*results)]
 
-        bo, bg, bw, rs = producer.fluids
-        ttglr = producer.ttglr
-        s_cum, s_rate, s_ffw, s_ffg, onset, wct_ini = scalers
+    def _is_adaptive(self):
+        return (self._tolerance is not None) and (self._convergence is not None)
+
+    def _simulate_block_potentials(self, potentials, xf, xs):
+        """
+        Simulates the production potentials in blocks of samples, creating the profiles as each block completes. If
+        adaptive, until the confidence intervals of the L/M/H percentiles of the field extraction summaries are within
+        the tolerance, or the maximum number of samples is reached. The convergence is tracked on the potentials, also
+        when the case is constrained. The number of samples is reduced to the converged number of samples.
+        :param potentials: dict, cached potentials {producer_id: array (samples, time, 6)}, used as far as they reach
+        :param xf: sampled function uncertainty matrix
+        :param xs: sampled static uncertainty matrix
+        :return: dict, {producer_id: array (samples, time, 6)} of the producers with simulated samples
+        """
+        producers = list(self._producers.values())
+
+        if not producers:
+            self._complete_samples({}, 0, self._samples)
+            return {}
+
+        adaptive = self._is_adaptive()
+
+        blocks = {prod.id: [] for prod in producers}
+        summaries = []  # field extraction summaries of each block, (samples, summaries)
+        simulated = set()
+
+        for a in range(0, self._samples, _ADAPTIVE_BLOCK):
+            b = min(a + _ADAPTIVE_BLOCK, self._samples)
+
+            # simulate the block for producers without cached potentials of the block
+            missing = [prod for prod in producers if (prod.id not in potentials) or (len(potentials[prod.id]) < b)]
+            values = []
+
+            if missing:
+                values = self._simulate_parallel_potentials(missing, xf[a:b, :], xs[:, :, a:b])
+
+                if values is None:
+                    values = self._simulate_production_chunk(missing, xf[a:b, :], xs[:, :, a:b])
+
+            values = dict(zip([prod.id for prod in missing], values))
+            simulated.update(values)
+
+            for prod in producers:
+                blocks[prod.id].append(values[prod.id] if prod.id in values else potentials[prod.id][a:b, :, :])
+
+            self._complete_samples({id_: block[-1] for id_, block in blocks.items()}, a, b)
+
+            if not adaptive:
+                continue
+
+            # field total of the extraction summaries of the block
+            field = []
+
+            for prod in producers:
+                summary = self._convergence.evaluate(self._block_ensemble(prod, blocks[prod.id][-1]),
+                                                     prod.GetPropertyMap())
+                field.append(summary.values)
+
+            summaries.append(np.sum(field, axis=0))
+
+            if self._converged(np.concatenate(summaries)):
+                break
+
+        self._samples = b
+
+        return {id_: np.concatenate(blocks[id_]) for id_ in simulated}
+
+    def _block_ensemble(self, prod, values):
+        # ensemble of the potentials of a block of samples of a producer, with the cumulative offsets of its history
+        ensemble = Ensemble(self._dateline, values.shape[0])
+        ensemble.values[...] = values
+
+        if prod.history is not None:
+            profile = Profile()
+            profile.set_offset(prod.history)
+            ensemble.offsets[...] = profile.offset
+
+        return ensemble
+
+    def _converged(self, summaries):
+        """
+        Checks whether the L/M/H percentiles of the extraction summaries have converged within the tolerance
+        :param summaries: array (samples, summaries) of field extraction summaries
+        :return: bool
+        """
+        lower, upper = percentile_confidence(summaries, self._cases)
+        estimate = np.percentile(summaries, self._cases, axis=0)
+
+        # an interval which can not yet be bounded by the samples is nan and not converged
+        with np.errstate(invalid='ignore'):
+            return bool(np.all((upper - lower) <= self._tolerance * np.abs(estimate)))
+
+    def _simulate_production_chunk(self, producers, xf, xs):
+        """
+        Simulates the production potentials of producers for a chunk of samples
+        :param producers: list of class ProducerSimulation()
+        :param xf: sampled function uncertainty matrix of the chunk, shape (samples, polygons)
+        :param xs: sampled static uncertainty matrix of the chunk, shape (polygons, variables, samples)
+        :return: list of arrays (samples, time, 6), one per producer
+        """
+        samples = xf.shape[0]
+        potentials = [np.zeros((samples, self._dateline.size, 6)) for _ in producers]
+
+        # sample functions and scalers, grouping realizations that share functions for batched simulation --------------
+        batches = {}  # {id(functions): (functions, [producer, ...], [(index, sample), ...], [scalers, ...])}
+
+        for j, prod in enumerate(producers):
+
+            # sample the statics and scalers with uncertainty of all samples at once
+            typecurves = [self._typecurves[id_] for id_ in prod.get_typecurves()]
+            statics = {}
+            if typecurves:
+                statics = {id(entity): self._sample_statics(entity, xs) for entity in [prod] + typecurves}
+
+            sampled_scalers = self._sample_scalers(prod, xs)
+
+            for i in range(0, samples):
+
+                # sample function and potential typecurve id
+                functions, id_ = prod.sample_functions(xf, i)
+
+                # transform samples into scalers parameters
+                if id_ is not None:
+                    typecurve = self._typecurves[id_]
+                else:
+                    typecurve = None
+
+                scalers = self._static_to_scalers(prod, typecurve, statics, i)
+                scalers = self._assign_scalers(prod, scalers, sampled_scalers, i)
+                self._well_spacing_adjustment(prod, typecurve, scalers)
+
+                batch = batches.setdefault(id(functions), (functions, [], [], []))
+                batch[1].append(prod)
+                batch[2].append((j, i))
+                batch[3].append(scalers)
+
+        # simulate production potentials -------------------------------------------------------------------------------
+        for functions, producers, indices, scalers in batches.values():
+            values = self._simulate_production_potentials(producers, functions, scalers)
+
+            for (j, i), value in zip(indices, values):
+                potentials[j][i, :, :] = value
+
+        return potentials
+
+    def _simulate_production_potentials(self, producers, functions, scalers):
+        """
+        Simulates the production potential of a batch of realizations sharing the same functions. The cut-cum
+        recurrence is stepped in time, but each time-step is evaluated for all realizations at once.
+        :param producers: list of ProducerSimulation, one per realization
+        :param functions: list of [liquid_potential, water_cut, gas_oil_ratio] or None
+        :param scalers: list of scalers [s_cum, s_rate, s_ffw, s_ffg, onset, wct_ini], one per realization
+        :return: array (realizations, time, 6)
+        """
+        values = np.zeros((len(producers), self._dateline.size, 6))
+
+        if functions is None:
+            return values
+
+        # simulate in batches of realizations --------------------------------------------------------------------------
+        for k in range(0, len(producers), _BATCH_SIZE):
+            batch = slice(k, k + _BATCH_SIZE)
+            values[batch, :, :3] = self._simulate_production_batch(producers[batch], functions, scalers[batch])
+
+        # calculate lift-gas requirements ------------------------------------------------------------------------------
+        for producer, value in zip(producers, values):
+            self._simulate_gas_lift_potential(value, producer.ttglr)
+
+        return values
+
+    def _simulate_production_batch(self, producers, functions, scalers):
+        liquid_potential, water_cut, gas_oil_ratio = functions
+
+        n = len(producers)
+        t = self._timeline.size
+
+        # row-wise fluids and scalers, shape (n,)
+        bo, bg, bw, rs = np.asarray([producer.fluids for producer in producers], dtype=np.float64).T
+        s_cum, s_rate, s_ffw, s_ffg, onset, wct_ini = np.asarray(scalers, dtype=np.float64).T
 
         # calculate liquid potential vs time ---------------------------------------------------------------------------
-        liquid = liquid_potential.eval(self._timeline) * s_rate
+        liquid = np.outer(s_rate, liquid_potential.eval(self._timeline))
 
         # calculate GOR vs time ----------------------------------------------------------------------------------------
         gor = gas_oil_ratio.eval(self._timeline)
 
         # cut-cum scaling preparation ----------------------------------------------------------------------------------
-        delta = np.zeros(self._dateline.size)
-        if onset:
-            delta = np.exp(-self._timeline / onset)
+        delta = np.zeros((n, t))
+        scaled = onset != 0.
+        delta[scaled, :] = np.exp(-self._timeline / onset[scaled, None])
+
+        dt = self._timeline[1:] - self._timeline[:-1]
+
+        # upper bound of the oil cumulative, as the surface oil rate can not exceed the reservoir volume rate / bo
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reservoir = liquid * (bo[:, None] + bg[:, None] * np.maximum(gor - rs[:, None], 0.) + bw[:, None])
+            upper = np.sum(reservoir[:, :-1] / bo[:, None] * dt, axis=1) / 1e3 / s_cum
+
+        upper[~np.isfinite(upper)] = 0.  # evaluated exactly
+        water_cut = self._tabulate(water_cut, np.max(upper, initial=0.))
 
-        if wct_ini:
+        cum_ini = np.zeros(n)
+        for j in np.flatnonzero(wct_ini):
             try:
-                cum_ini = secant(lambda x: water_cut.eval(x) - wct_ini, 0., 1.)
+                cum_ini[j] = water_cut.inverse(wct_ini[j])
             except ConvergenceError as e:
-                raise ConvergenceError('{} failed to assign initial water-cut due to: {}'.format(producer.name, str(e)))
-        else:
-            cum_ini = 0.
+                raise ConvergenceError('{} failed to assign initial water-cut due to: {}'.format(producers[j].name,
+                                                                                                 str(e)))
+
+        water_cut = self._tabulate(water_cut, np.max(upper + cum_ini, initial=0.))
 
         # time-step ----------------------------------------------------------------------------------------------------
-        cum = 0.
-        dt = self._timeline[1:] - self._timeline[:-1]
+        values = np.zeros((n, t, 3))
+        cum = np.zeros(n)
 
-        for i, _ in enumerate(self._timeline):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(t):
 
-            wct = water_cut.eval(cum / s_cum + cum_ini)
+                wct = water_cut.eval(cum / s_cum + cum_ini)
 
-            # calculate flow at reservoir conditions
-            oil = liquid[i] * (1. - wct)
-            oil_res = bo * oil
-            gas_res = bg * max(gor[i] - rs, 0.) * oil
-            water_res = bw * liquid[i] * wct
-            hydrocarbon = oil_res + gas_res
-            reservoir = hydrocarbon + water_res
+                # calculate flow at reservoir conditions
+                oil = liquid[:, i] * (1. - wct)
+                oil_res = bo * oil
+                gas_res = bg * np.maximum(gor[i] - rs, 0.) * oil
+                water_res = bw * liquid[:, i] * wct
+                hydrocarbon = oil_res + gas_res
+                reservoir = hydrocarbon + water_res
 
-            # scaling the water-hydrocarbon ratio and free-gas oil ratio with the fractional flow scalers
-            whcr = water_res / hydrocarbon * (s_ffw + (1. - s_ffw) * delta[i])
-            fgor = gas_res / oil_res * (s_ffg + (1. - s_ffg) * delta[i])
+                # scaling the water-hydrocarbon ratio and free-gas oil ratio with the fractional flow scalers
+                whcr = water_res / hydrocarbon * (s_ffw + (1. - s_ffw) * delta[:, i])
+                fgor = gas_res / oil_res * (s_ffg + (1. - s_ffg) * delta[:, i])
 
-            # calculating the fractional flows of water and gas respectively
-            ffw = whcr / (1. + whcr)
-            ffg = fgor / (1. + fgor)
+                # calculating the fractional flows of water and gas respectively
+                ffw = whcr / (1. + whcr)
+                ffg = fgor / (1. + fgor)
 
-            # calculating the scaled flows at surface
-            profile.values[i, 2] = reservoir * ffw / bw
-            profile.values[i, 0] = reservoir * (1. - ffw) * (1. - ffg) / bo
-            profile.values[i, 1] = rs * profile.values[i, 0] + reservoir * (1. - ffw) * ffg / bg
+                # calculating the scaled flows at surface
+                values[:, i, 2] = reservoir * ffw / bw
+                values[:, i, 0] = reservoir * (1. - ffw) * (1. - ffg) / bo
+                values[:, i, 1] = rs * values[:, i, 0] + reservoir * (1. - ffw) * ffg / bg
 
-            # update the cumulative oil using forward integration for the cut-cum calculation
-            try:
-                cum += profile.values[i, 0] * dt[i] / 1e3
-            except IndexError:
-                pass  # last time-step, cum not used going forward.
+                # update the cumulative oil using forward integration for the cut-cum calculation
+                if i < dt.size:
+                    cum += values[:, i, 0] * dt[i] / 1e3
 
-        # calculate lift-gas requirements ------------------------------------------------------------------------------
-        self._simulate_gas_lift_potential(profile, ttglr)
+        return values
 
-        return profile
+    def _tabulate(self, function, upper):
+        """
+        Tabulates a function on [0, upper] for fast look-ups, re-using and extending the table of the function.
+        The table is independent of the range requested, hence of the batch of samples it is requested for
+        :param function: AssemblyFunction or TabulatedFunction
+        :param upper: float, upper limit of the tabulated range
+        :return: class TabulatedFunction()
+        """
+        if isinstance(function, TabulatedFunction):
+            function = function.GetFunction()
+
+        if id(function) not in self._tables:
+            self._tables[id(function)] = TabulatedFunction(function, tolerance=self._tabulation)
 
-    def _static_to_scalers(self, prod, typecurve, x, i):
+        table = self._tables[id(function)]
+
+        table.tabulate(upper)
+
+        return table
+
+    def _static_to_scalers(self, prod, typecurve, statics, i):
+        """
+        Scalers of a sample evaluated from the sampled statics of the producer and its typecurve
+        :param prod: class ProducerSimulation()
+        :param typecurve: class TypecurveSimulation() or None
+        :param statics: dict, {id(entity): sampled statics of all samples}, see _sample_statics
+        :param i: sample index
+        :return: list of 6 scalers
+        """
         scalers = [None for _ in range(6)]
 
         if typecurve is not None:
-            statics = self._sample_statics(prod, x, i)
-            tc_statics = self._sample_statics(typecurve, x, i)
-            scalers = self._evaluate_scalers(prod, statics, tc_statics)
+            prod_statics = [s[i] if np.ndim(s) else s for s in statics[id(prod)]]
+            tc_statics = [s[i] if np.ndim(s) else s for s in statics[id(typecurve)]]
+            scalers = self._evaluate_scalers(prod, prod_statics, tc_statics)
 
         return scalers
 
@@ -1295,31 +2046,43 @@ class PredictionCase(SimulationCase):
         if self._samples < 2:
             return
 
-        m = len(variables)
-        s = 2
+        statistics = RunningStatistics(len(variables))
 
-        # fill array with summed values from each realization
-        _array = np.zeros((self._samples, m))
+        for values in self._stability_samples(variables, range(self._samples)):
+            statistics.update(values)
 
-        for i in range(self._samples):
-            profile = Profile()
-            profile.allocate(self._dateline)
-            profile.sum([p.profiles[i] for p in self._get_wells()])
+        # statistical properties as a function of sample size, excluding the full sample size
+        return statistics.history()[:-1, :, :]
+
+    def _stability_samples(self, variables, samples, block=_BATCH_SIZE):
+        """
+        Generates the field values used for stochastic stability, in blocks of samples as they are summed
+        :param variables: tuple, (oil rate, oil cumulative, water-cut, GOR) variables
+        :param samples: range, samples of which to generate the field values
+        :param block: int, number of samples summed at once
+        :return: generator of arrays (samples, 4)
+        """
+        wells = self._get_wells()
 
-            _array[i, 0] = np.sum(profile.Get(variables[0].GetId()))    # oil rate
-            _array[i, 1] = profile.Get(variables[1].GetId())[-1]        # oil cum
-            _array[i, 2] = np.mean(profile.Get(variables[2].GetId()))   # water-cut
-            _array[i, 3] = np.mean(profile.Get(variables[3].GetId()))   # GOR
+        for a in range(samples.start, samples.stop, block):
+            batch = range(a, min(a + block, samples.stop))
 
-        # calculating statistical properties as a function of sample size for each variable
-        stability = np.zeros((self._samples - 1, m, s))
+            # sum all wells of each sample in the block as a field ensemble
+            field = Ensemble(self._dateline, len(batch))
+            rates = np.zeros(field.values.shape)
 
-        for i in range(self._samples - 1):
-            for j, variable in enumerate(variables):
-                stability[i, j, 0] = np.mean(_array[:(i+1), j])
-                stability[i, j, 1] = np.std(_array[:(i + 1), j])
+            for well in wells:
+                ensemble = Ensemble.stack([well.profiles[i] for i in batch])
+                field.add(ensemble)
+                rates += ensemble.rates()
 
-        return stability
+            field.calculate_uptime(rates)
+
+            yield np.stack((np.sum(field.get(variables[0].GetId()), axis=1),     # oil rate
+                            field.get(variables[1].GetId())[:, -1],              # oil cum
+                            np.mean(field.get(variables[2].GetId()), axis=1),    # water-cut
+                            np.mean(field.get(variables[3].GetId()), axis=1)),   # GOR
+                           axis=1)
 
     @staticmethod
     def _well_spacing_adjustment(producer, typecurve, scalers):
@@ -1339,3 +2102,12 @@ class PredictionCase(SimulationCase):
         ratio = p_spacing / t_spacing
         scalers[0] *= ratio
         scalers[1] *= 1. / ratio ** 0.75
+
+
+# ======================================================================================================================
+# Process pool workers
+# ======================================================================================================================
+def _simulate_production_chunk(case, ids, xf, xs):
+    # worker of PredictionCase._simulate_parallel_potentials, case is the pickled PredictionCase
+    case = pickle.loads(case)
+    return case._simulate_production_chunk([case._producers[id_] for id_ in ids], xf, xs)
@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from scipy.special import ndtr
 
 
 # ======================================================================================================================
@@ -8,7 +9,7 @@ import numpy as np
 def stnormal2swanson(x, a, c, b):
     # a = min, c = mode, b = max
     u = stnormal2stuniform(x)
-    return np.where(u < 0.3, a, np.where(0.3 <= u < 0.7, c, b))
+    return np.where(u < 0.3, a, np.where(u < 0.7, c, b))
 
 
 def stnormal2triangular(x, a, c, b):
@@ -37,28 +38,94 @@ def stnormal2normal(x, mu, sigma):
 
 def stnormal2stuniform(x):
     # standard normal distribution to standard uniform in (0, 1)
-    return .5 * (1. + erf(x / math.sqrt(2.)))
+    return ndtr(x)
 
 
-# from https://stackoverflow.com/questions/457408/is-there-an-easily-available-implementation-of-erf-for-python
-# answer by John D. Cook
-def erf(x):
-    # save the sign of x
-    sign = np.where(x >= 0., 1., -1.)
-    x_ = abs(x)
+# ======================================================================================================================
+# Correlation
+# ======================================================================================================================
+def correlation_factor(rho):
+    """
+    Lower factor L of a correlation matrix, rho = L L^T, such that L z is correlated for standard normal z.
+    A matrix which is not positive definite is repaired to the nearest positive semi-definite correlation matrix by
+    clipping negative eigenvalues and re-scaling to a unit diagonal.
+    :param rho: array, correlation matrix (n, n)
+    :return: array (n, n)
+    """
+    rho = np.asarray(rho, dtype=np.float64)
+    rho = (rho + rho.T) / 2.
+
+    try:
+
+        return np.linalg.cholesky(rho)
 
-    # constants
-    a1 = 0.254829592
-    a2 = -0.284496736
-    a3 = 1.421413741
-    a4 = -1.453152027
-    a5 = 1.061405429
-    p = 0.3275911
+    except np.linalg.LinAlgError:
 
-    # A&S formula 7.1.26
-    t = 1.0 / (1.0 + p * x_)
-    y = 1.0 - (((((a5 * t + a4) * t) + a3) * t + a2) * t + a1) * t * np.exp(-x_ ** 2.)
-    return sign * y
+        w, v = np.linalg.eigh(rho)
+        factor = v * np.sqrt(np.maximum(w, 0.))
+        norm = np.sqrt(np.sum(factor ** 2., axis=1))
+        norm[norm == 0.] = 1.
+
+        return factor / norm[:, None]
+
+
+# ======================================================================================================================
+# Running statistics
+# ======================================================================================================================
+class RunningStatistics:
+    """
+    Single-pass running mean and standard deviation of a number of variables, updated as blocks of samples complete.
+    Each block is merged with the running statistics by the parallel algorithm of Chan et al. (count, mean and sum of
+    squared differences), for all prefixes of the block at once. The statistics after each sample are recorded, such
+    that convergence can be displayed while sampling.
+    """
+    def __init__(self, m):
+        self.count = 0             # int, number of samples
+        self.mean = np.zeros(m)    # array, running mean of each variable
+        self._m2 = np.zeros(m)     # array, running sum of squared differences from the mean
+        self._history = []         # list, arrays (k, m, 2) of mean and standard deviation after each sample of a block
+
+    def update(self, x):
+        """
+        Updates the statistics with one or more samples
+        :param x: array_like, a sample (m,) or samples (k, m)
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+        if not x.shape[0]:
+            return
+
+        # statistics of each prefix of the block, shifted by a reference value to avoid cancellation
+        shift = self.mean if self.count else x[0, :]
+        n_b = np.arange(1, x.shape[0] + 1)[:, None]
+        s = np.cumsum(x - shift, axis=0)
+        mean_b = shift + s / n_b
+        m2_b = np.maximum(np.cumsum((x - shift) ** 2., axis=0) - s ** 2. / n_b, 0.)
+
+        # merge each prefix with the running statistics
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        mean = self.mean + delta * n_b / n
+        m2 = self._m2 + m2_b + delta ** 2. * self.count * n_b / n
+
+        self._history.append(np.stack((mean, np.sqrt(m2 / n)), axis=-1))
+
+        self.count += x.shape[0]
+        self.mean = mean[-1, :]
+        self._m2 = m2[-1, :]
+
+    def std(self):
+        # population standard deviation, as numpy.std
+        if not self.count:
+            return np.zeros_like(self.mean)
+
+        return np.sqrt(self._m2 / self.count)
+
+    def history(self):
+        # mean and standard deviation after each sample, (samples, m, 2)
+        if not self._history:
+            return np.zeros((0, self.mean.size, 2))
+
+        return np.concatenate(self._history)
 
 
 # ======================================================================================================================
@@ -159,25 +226,53 @@ def extract_realizations(ensemble, ids, weights, percentiles):
         List of percentile values, such as 10.0 for P10, 50.0 for P50, etc.
     """
 
-    # preparation
-    n = len(ensemble)
-    m = len(ids)
+    # values of the various variables of each realization
+    values = np.array([[realization[id_] for id_ in ids] for realization in ensemble], dtype=np.float64)
+    values = values.reshape(len(ensemble), len(ids))
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), (values.shape[1],))
+
+    # calculate the percentile score of each profile, equal to percentileofscore(values[:, j], values[i, j])
+    scores = percentile_ranks(values)
+
+    # distance of each profile to each percentile, summed in order of the variables (as the built-in sum)
+    percentiles = np.asarray(percentiles, dtype=np.float64)
+    distance = np.zeros((percentiles.size, values.shape[0]))
+    for j in range(values.shape[1]):
+        distance += (scores[None, :, j] - percentiles[:, None]) ** 2. * weights[j]
+
+    # find the index of the best suited representative profile of each percentile. Equal to the built-in min, which
+    # returns the first of equal distances, ignores nan distances, but returns the first profile if its distance is nan
+    index = np.argmin(np.where(np.isnan(distance), np.inf, distance), axis=1)
+    index[np.isnan(distance[:, 0])] = 0
+
+    return index.tolist()
 
-    # calculate all values of the various variables based on the functions
-    values = np.zeros((n, m))
 
-    for i, realization in enumerate(ensemble):
-        for j, id_ in enumerate(ids):
-            values[i, j] = realization[id_]
+def percentile_ranks(values):
+    """
+    Percentile rank of each value relative to its column, equal to percentileofscore(values[:, j], values[i, j])
+    with kind='rank', but calculated by sorting in O(n log n) per column. As percentileofscore, a column containing
+    nan is propagated as nan.
+    Parameters
+    ----------
+    values : array_like
+        Array (n, m) of values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[0]
+    ranks = np.full(values.shape, np.nan)
+
+    for j in range(values.shape[1]):
+        column = np.sort(values[:, j])
 
-    # calculate the percentile score of each profile
-    scores = np.zeros((n, m))
+        left = np.searchsorted(column, values[:, j], side='left')
+        right = np.searchsorted(column, values[:, j], side='right')
 
-    for i in range(n):
-        scores[i, :] = np.asarray([percentileofscore(values[:, j], values[i, j]) for j in range(m)], dtype=np.float64)
+        ranks[:, j] = (right + left + (right > left)) * 50.0 / n
 
-    # find the index of the best suited representative profile of each percentile
-    return [min(range(n), key=lambda i: sum((scores[i, :] - p) ** 2. * weights)) for p in percentiles]
+    ranks[:, np.isnan(values).any(axis=0)] = np.nan
+
+    return ranks
 
 
 def ExtractRealizations(ensemble, ids, weights, percentiles):
@@ -192,27 +287,15 @@ def ensemble_distribution(ensemble, variable, percentiles):
     Calculates the ensemble percentiles for a given ensemble at each time-step
     Parameters
     ----------
-    ensemble : list
-        List of class Profile()
+    ensemble : class Ensemble
+        Ensemble of profiles on a shared dateline
     variable : str
-        Variable id passed to each realization in the ensemble
+        Variable id passed to the ensemble
     percentiles: list
          List of percentiles values, such as 10.0 for P10, 50.0 for P50, etc.
     """
-    dateline = ensemble[0].dates
-    n = len(dateline)
-    m = len(ensemble)
-    p = len(percentiles)
-
-    array = np.zeros((n, m))
-    for i, realization in enumerate(ensemble):
-        array[:, i] = realization.Get(variable)
-
-    distribution = np.zeros((n, p))
-    for i in range(n):
-        distribution[i, :] = np.percentile(array[i, :], percentiles, overwrite_input=True)
-
-    return distribution
+    # all percentiles of all time-steps of the (samples, time) block in a single call, (p, n) -> (n, p)
+    return np.percentile(ensemble.get(variable), percentiles, axis=0).T
 
 
 def EnsembleDistribution(ensemble, variable, percentiles):
@@ -220,6 +303,46 @@ def EnsembleDistribution(ensemble, variable, percentiles):
     return ensemble_distribution(ensemble, variable, percentiles)
 
 
+# -------------------------------------------------------------------------------------------------------------------- #
+
+def percentile_confidence(values, percentiles, z=1.959963984540054):
+    """
+    Distribution-free confidence interval of percentiles, bounded by the order statistics at the ranks given by the
+    normal approximation to the binomial distribution of the number of samples below each percentile
+    Parameters
+    ----------
+    values : array_like
+        Array (n, m) of samples of m variables
+    percentiles : list
+        List of percentile values, such as 10.0 for P10, 50.0 for P50, etc.
+    z : float
+        Standard normal quantile of the two-sided confidence level, default 95%
+
+    Returns
+    -------
+    tuple
+        Arrays (percentiles, m) of the lower and upper bounds, nan if there are too few samples to bound the interval
+    """
+    values = np.sort(np.asarray(values, dtype=np.float64), axis=0)
+    n = values.shape[0]
+
+    q = np.asarray(percentiles, dtype=np.float64) / 100.
+    half = z * np.sqrt(n * q * (1. - q))
+
+    # 1-based ranks of the order statistics bounding the interval
+    lower = np.floor(n * q - half).astype(np.int64)
+    upper = np.ceil(n * q + half).astype(np.int64)
+    valid = (lower >= 1) & (upper <= n)
+
+    bounds = []
+    for rank in (lower, upper):
+        bound = values[np.clip(rank, 1, n) - 1, :]
+        bound[~valid, :] = np.nan
+        bounds.append(bound)
+
+    return tuple(bounds)
+
+
 # ======================================================================================================================
 # Experimental Designs
 # ======================================================================================================================
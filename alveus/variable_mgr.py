@@ -2743,9 +2743,94 @@ class Samples(Variable):
 
         self._pytype = int
 
-        self._tooltip = 'Number of stochastic samples to run.'
+        self._tooltip = 'Number of stochastic samples to run.\n' \
+                        'With a convergence tolerance, the maximum number of samples to run.'
 
 
+class Processes(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._unit = AmountUnit()
+        self._frame_label = '# of processes'
+        self._plot_label = 'Processes'
+        self._limits = (1., None)
+
+        self._pytype = int
+
+        self._tooltip = 'Number of processes to run the samples in parallel.\n' \
+                        'Samples are split into one chunk per process.'
+
+
+class Seed(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._unit = AmountUnit()
+        self._frame_label = 'Seed'
+        self._plot_label = 'Seed'
+        self._limits = (0., None)
+
+        self._pytype = int
+
+        self._tooltip = 'Seed of the random number generator.\n' \
+                        'Identical inputs and seed reproduce identical samples.'
+
+
+class ConvergenceTolerance(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._unit = PercentageUnit()
+        self._frame_label = 'Tolerance'
+        self._plot_label = 'Convergence Tolerance'
+        self._limits = (0., None)
+
+        self._round_off = 1
+        self._pytype = float
+
+        self._tooltip = 'Samples are run in blocks until the 95% confidence interval of the L/M/H percentiles\n' \
+                        'of the extraction summaries is narrower than the tolerance, relative to the percentile.\n' \
+                        'Leave empty to run the specified number of samples.'
+
+
+class SamplingMethod(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._frame_label = 'Method'
+        self._choices = ('Random', 'Latin hypercube', 'Sobol')
+        self._choice_images = (None, None, None)
+
+        self._tooltip = 'Random samples each uncertainty independently.\n' \
+                        'Latin hypercube and Sobol spread the samples evenly over the uncertainty space,\n' \
+                        'requiring fewer samples for stable L/M/H percentiles.'
+
+        self._pytype = tuple
+
+
+class CompactSamples(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._frame_label = 'Compact storage'
+
+        self._pytype = bool
+
+        self._tooltip = 'Store the sampled profiles in single precision.\n' \
+                        'Halves the memory and saved file size of the profiles,\n' \
+                        'with a relative error below 5e-7.'
+
+
+class TabulationTolerance(Variable):
+    def __init__(self, unit_system=None):
+        super().__init__()
+        self._unit = FractionUnit()
+        self._frame_label = 'Tabulation'
+        self._plot_label = 'Tabulation Tolerance'
+        self._limits = (0., None)
+
+        self._round_off = 9
+        self._pytype = float
+
+        self._tooltip = 'Maximum absolute error of the water-cut functions, which are tabulated\n' \
+                        'for fast evaluation during the simulation. Default is 1e-6.'
+
 
 # ======================================================================================================================
 # Scenario and Event Variables
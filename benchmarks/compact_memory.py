@@ -0,0 +1,75 @@
+"""
+Memory of the sampled profiles kept after a prediction, in double precision and in compact single precision storage.
+
+An ensemble of random potentials and uptimes is created per well, and compacted for the compact storage. The memory
+traced by tracemalloc and the pickled size (as saved with the project) are reported. On a tree without compact storage
+only double precision is reported, such that earlier versions can be compared by running the script in their checkout.
+
+Usage: python benchmarks/compact_memory.py [--wells 500] [--samples 1000] [--years 25] [--views]
+"""
+import argparse
+import os
+import pickle
+import sys
+import tracemalloc
+
+import numpy as np
+
+# alveus uses flat imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'alveus'))
+
+from profile_ import Ensemble
+
+
+def make_ensembles(wells, samples, years, compact, views):
+    dateline = np.arange(np.datetime64('2025-01-01'), np.datetime64('{}-01-01'.format(2025 + years)),
+                         np.timedelta64(365, 'D'))
+
+    rng = np.random.default_rng(0)
+    values = rng.random((samples, dateline.size, 6))
+    uptimes = rng.random((samples, dateline.size, 4))
+
+    tracemalloc.start()
+    ensembles = []
+
+    for _ in range(wells):
+        ensemble = Ensemble(dateline, samples)
+        ensemble.values[...] = values
+        ensemble.uptimes[...] = uptimes
+
+        if compact:
+            ensemble.compact()
+
+        if views:
+            list(ensemble)  # creates the Profile view of every sample
+
+        ensembles.append(ensemble)
+
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # all ensembles are equal in size, so a single one is pickled
+    pickled = len(pickle.dumps(ensembles[0], protocol=pickle.HIGHEST_PROTOCOL)) * wells
+
+    return dateline.size, memory, pickled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--wells', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=25)
+    parser.add_argument('--views', action='store_true', help='access the Profile view of every sample')
+    args = parser.parse_args()
+
+    modes = (('Double', False), ('Compact', True)) if hasattr(Ensemble, 'compact') else (('Double', False),)
+
+    for name, compact in modes:
+        steps, memory, pickled = make_ensembles(args.wells, args.samples, args.years, compact, args.views)
+
+        print('{:<8} {} wells x {} samples x {} time-steps: memory {:.0f} MB, pickled {:.0f} MB'.format(
+            name, args.wells, args.samples, steps, memory / 2 ** 20, pickled / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
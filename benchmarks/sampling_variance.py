@@ -0,0 +1,131 @@
+"""
+Variance of the L/M/H percentile estimates of the field oil cumulative, for random, Latin hypercube and Sobol sampling.
+
+A prediction case of producers with uncertain cumulative and rate scalers, correlated polygons and a selection among
+three typecurve function sets is run for a number of seeds with each sampling method. The variance of the P10, P50 and
+P90 estimates over the seeds is reported relative to random sampling (> 1. is a reduction).
+
+Usage: python benchmarks/sampling_variance.py [--producers 6] [--samples 128] [--seeds 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# alveus uses flat imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'alveus'))
+
+import properties as pro
+import simulate as sim
+from curve_fit import AssemblyFunction, CurveModelFit
+from profile_ import Ensemble
+from _ids import *
+
+
+_METHODS = (('Random', ID_SAMPLING_RANDOM),
+            ('Latin hypercube', ID_SAMPLING_LATIN_HYPERCUBE),
+            ('Sobol', ID_SAMPLING_SOBOL))
+
+_PERCENTILES = (10., 50., 90.)
+
+
+def model(method, parameters):
+    m = CurveModelFit(np.zeros(0), np.zeros(0))
+    m.Set(method, None, parameters)
+    return m
+
+
+def functions(scale):
+    # liquid potential, water-cut and GOR functions of a typecurve
+    liquid_potential = AssemblyFunction()
+    liquid_potential.SetInitial(model(ID_EXP, [0.001 * scale, 5., 0.5]), 1., 0.)
+    liquid_potential.Add(model(ID_LIN, [-0.0001, 3.]), ID_SMOOTH, 1500., 0.01, 1., 0.)
+    liquid_potential.SetLimits((0., None))
+
+    water_cut = AssemblyFunction()
+    water_cut.SetInitial(model(ID_LIN, [0.05 * scale, 0.02]), 1., 0.)
+    water_cut.Add(model(ID_LIN, [0.001, 0.6]), ID_SMOOTH, 6., 2., 1., 0.)
+    water_cut.Add(model(ID_LIN, [0.02, 0.55]), ID_COND, 0.55, 1., 1., 0.)
+    water_cut.SetLimits((0., 1.))
+
+    gas_oil_ratio = AssemblyFunction()
+    gas_oil_ratio.SetInitial(model(ID_LIN, [0.0002, 0.8]), 1., 0.)
+    gas_oil_ratio.SetLimits((0., None))
+
+    return [liquid_potential, water_cut, gas_oil_ratio]
+
+
+def make_case(producers, samples, seed, method, polygons=2):
+    properties = pro.PredictionProperties()
+    properties.timeline.Set(ID_MONTHLY, None)
+    properties.sampling.Set(samples, True, 1, seed, None, method)
+    case = sim.PredictionCase(properties)
+
+    function_sets = [functions(1.), functions(1.3), functions(.8)]
+    producers_ = {}
+
+    for k in range(producers):
+        prod_properties = pro.ProducerProperties()
+        prod_properties.res_fluids.Set(True, 1.2, 0.005, 1.01, 0.5)
+        prod_properties.scalers.Set(True, 1. + .1 * (k % 10), 1. - .05 * (k % 10), 1., 1., None, None)
+        prod_properties.scalers_unc.Set(True, (ID_DIST_UNIFORM, -20., 20., None), (ID_DIST_TRIANGULAR, -10., 0., 15.),
+                                        (None,), (None,), (None,), (None,))
+
+        prod = sim.ProducerSimulation(prod_properties)
+        prod.id = 100 + k
+        prod.name = 'P{}'.format(k)
+        prod.polygon_id = k % polygons
+
+        # low, mid and high functions are assigned directly, rather than assembled from typecurve entities
+        prod._functions = function_sets
+        prod._occurrences = (.3, .7)
+        producers_[prod.id] = prod
+
+    case.SetEntities(producers_, {}, polygons={i: sim.SimulationEntity() for i in range(polygons)}, typecurves={})
+    case.SetDuration(np.datetime64('2020-01-15'), np.datetime64('2045-01-01'))
+
+    rho_v = np.eye(11).tolist()
+    rho_e = (np.eye(polygons) * .5 + .5).tolist()
+
+    return case, rho_v, rho_e
+
+
+def field_cumulative(case):
+    # field oil cumulative at the end of the timeline, (samples,)
+    return sum(Ensemble.stack(prod.profiles).get('oil_cumulative')[:, -1] for prod in case._producers.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--producers', type=int, default=6)
+    parser.add_argument('--samples', type=int, default=128)
+    parser.add_argument('--seeds', type=int, default=30)
+    args = parser.parse_args()
+
+    estimates = {}
+
+    for name, method in _METHODS:
+        start = time.perf_counter()
+        estimates[name] = []
+
+        for seed in range(args.seeds):
+            case, rho_v, rho_e = make_case(args.producers, args.samples, seed, method)
+            case.Run(rho_v, rho_e)
+            estimates[name].append(np.percentile(field_cumulative(case), _PERCENTILES))
+
+        estimates[name] = np.asarray(estimates[name])
+        print('{:<16} mean {}  std {}  ({:.1f} s)'.format(name, estimates[name].mean(axis=0).round(1),
+                                                         estimates[name].std(axis=0).round(2),
+                                                         time.perf_counter() - start))
+
+    random = estimates[_METHODS[0][0]].var(axis=0)
+    for name, _ in _METHODS[1:]:
+        ratios = random / estimates[name].var(axis=0)
+        ratios = ', '.join('P{:.0f} {:.2f}x'.format(p, r) for p, r in zip(_PERCENTILES, ratios))
+        print('{:<16} variance reduction vs random: {}'.format(name, ratios))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import importlib.util
+
+import numpy as np
+from scipy.stats import percentileofscore
+
+# alveus uses flat imports and its statistics module shadows the standard library, so it is loaded by path
+_path = os.path.join(os.path.dirname(__file__), os.pardir, 'alveus', 'statistics.py')
+_spec = importlib.util.spec_from_file_location('alveus_statistics', _path)
+statistics = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(statistics)
+
+
+# ======================================================================================================================
+# Reference implementation (percentileofscore loop used before percentile_ranks)
+# ======================================================================================================================
+def legacy_scores(values):
+    n, m = values.shape
+    scores = np.zeros((n, m))
+    for i in range(n):
+        scores[i, :] = np.asarray([percentileofscore(values[:, j], values[i, j]) for j in range(m)], dtype=np.float64)
+
+    return scores
+
+
+def legacy_extract_realizations(values, weights, percentiles):
+    scores = legacy_scores(values)
+    n = values.shape[0]
+    return [min(range(n), key=lambda i: sum((scores[i, :] - p) ** 2. * weights)) for p in percentiles]
+
+
+def make_values(seed, n=40, m=4, nan=0):
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.normal(size=(n, m)) * 2.)  # rounding creates ties
+    for j in rng.choice(m, size=nan, replace=False):
+        values[rng.integers(n), j] = np.nan
+
+    return values
+
+
+def as_ensemble(values):
+    return [{j: value for j, value in enumerate(row)} for row in values]
+
+
+# ======================================================================================================================
+# Tests
+# ======================================================================================================================
+def test_percentile_ranks_with_ties():
+    for seed in range(20):
+        values = make_values(seed)
+        np.testing.assert_array_equal(statistics.percentile_ranks(values), legacy_scores(values))
+
+
+def test_percentile_ranks_with_nan():
+    for seed in range(20):
+        values = make_values(seed, nan=2)
+        np.testing.assert_array_equal(statistics.percentile_ranks(values), legacy_scores(values))
+
+
+def test_extract_realizations():
+    percentiles = [10., 50., 90.]
+    weights = np.array([1., 2., .5, 0.])
+
+    for seed in range(20):
+        for nan in (0, 1, 4):
+            values = make_values(seed, nan=nan)
+            ids = list(range(values.shape[1]))
+
+            expected = legacy_extract_realizations(values, weights, percentiles)
+            result = statistics.extract_realizations(as_ensemble(values), ids, weights, percentiles)
+
+            assert result == expected
+
+
+def test_running_statistics_blocks():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(5., 1., size=(700, 4)) * np.array([1e6, 1e8, 1e-2, 1e3])
+
+    running = statistics.RunningStatistics(4)
+    for block in np.split(values, [1, 3, 256, 512]):
+        running.update(block)
+
+    history = running.history()
+    assert history.shape == (700, 4, 2)
+
+    for n in (1, 2, 3, 100, 256, 257, 700):
+        np.testing.assert_allclose(history[n - 1, :, 0], values[:n, :].mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(history[n - 1, :, 1], values[:n, :].std(axis=0), rtol=1e-10, atol=1e-12)